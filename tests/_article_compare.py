@@ -0,0 +1,137 @@
+"""
+Сравнение артикулов результата парсинга с эталоном
+
+Общая логика для скриптов перебора промптов (test_all_items_prompts,
+test_all_prompts_dnipromash, test_additional_prompts, test_items_v2_20_configs).
+"""
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, Any, List, Optional, Tuple
+
+# Нормализация артикула: без пробелов, точек и дефисов (и слешей - по запросу)
+_ART_DEL = str.maketrans('', '', ' .-')
+_ART_DEL_SLASH = str.maketrans('', '', ' .-/')
+
+# Признаки ключей артикула и суффикса в названии колонки. По умолчанию -
+# правила test_additional_prompts/test_items_v2_20_configs; скрипты с
+# другими исходными правилами передают свои наборы
+ARTICLE_TOKENS = ('article', 'sku')
+SUFFIX_TOKENS = ('suffix', 'modifier')
+
+
+def _has_token(key: str, tokens: Tuple[str, ...]) -> bool:
+    key_lower = key.lower()
+    return any(token in key_lower for token in tokens)
+
+
+@lru_cache(maxsize=64)
+def _find_keys(
+    keys: Tuple[str, ...],
+    art_tokens: Tuple[str, ...],
+    suffix_tokens: Tuple[str, ...],
+    skip_suffix_keys: bool
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Ключи артикула и его суффикса для набора колонок
+
+    Схем строк в прогоне немного, поэтому результат кешируется по кортежу ключей.
+    При skip_suffix_keys колонки с 'suffix' в названии не считаются артикулом.
+    """
+    art_key = next(
+        (k for k in keys if _has_token(k, art_tokens) and not (skip_suffix_keys and 'suffix' in k.lower())),
+        None
+    )
+    suffix_key = next((k for k in keys if k != art_key and _has_token(k, suffix_tokens)), None)
+    return art_key, suffix_key
+
+
+def find_article_key(
+    row: Dict[str, Any],
+    art_tokens: Tuple[str, ...] = ARTICLE_TOKENS,
+    skip_suffix_keys: bool = True
+) -> Optional[str]:
+    """Находит ключ артикула в строке"""
+    return _find_keys(tuple(row), art_tokens, (), skip_suffix_keys)[0]
+
+
+def _column(rows: List[Dict[str, Any]], key: str) -> List[str]:
+    """
+    Значения колонки как строки без пробелов по краям
+
+    Если ключ есть во всех строках (обычный случай - он найден по первой
+    строке), значения выбираются через itemgetter, иначе через get с ''.
+    """
+    if all(key in row for row in rows):
+        return [str(value).strip() for value in map(itemgetter(key), rows)]
+    return [str(row.get(key, '')).strip() for row in rows]
+
+
+def compare(
+    result_items: List[Dict[str, Any]],
+    ref_items: List[Dict[str, Any]],
+    ref_art_key: Optional[str],
+    *,
+    join_suffix: bool = True,
+    ignore_slash: bool = False,
+    max_errors: Optional[int] = None,
+    art_tokens: Tuple[str, ...] = ARTICLE_TOKENS,
+    suffix_tokens: Tuple[str, ...] = SUFFIX_TOKENS,
+    skip_suffix_keys: bool = True
+) -> Dict[str, Any]:
+    """
+    Сравнивает артикулы построчно с эталоном
+
+    Args:
+        result_items: Строки результата парсинга
+        ref_items: Строки эталона
+        ref_art_key: Ключ артикула в эталоне (находится один раз вызывающим)
+        join_suffix: Присоединять к артикулу колонку суффикса, если она есть
+        ignore_slash: Не учитывать слеши при сравнении
+        max_errors: Сколько первых расхождений вернуть подробно
+            (None - все, 0 - только количество)
+        art_tokens: Подстроки названия колонки артикула в результате
+        suffix_tokens: Подстроки названия колонки суффикса
+        skip_suffix_keys: Не считать артикулом колонки с 'suffix' в названии
+
+    Returns:
+        total_rows, errors_count, errors и suffix_key,
+        либо {'error': ...}, если сравнивать нечего
+    """
+    if not result_items or not ref_items:
+        return {'error': 'Empty items'}
+
+    result_art_key, suffix_key = _find_keys(tuple(result_items[0]), art_tokens, suffix_tokens, skip_suffix_keys)
+
+    if not result_art_key or not ref_art_key:
+        return {'error': 'Article key not found'}
+
+    if not join_suffix:
+        suffix_key = None
+
+    min_len = min(len(result_items), len(ref_items))
+
+    # Значения артикулов (с suffix, если он есть) извлекаем по колонкам,
+    # строки результата не изменяем
+    result_rows = result_items[:min_len]
+    result_arts = _column(result_rows, result_art_key)
+    if suffix_key:
+        result_arts = [art + suffix for art, suffix in zip(result_arts, _column(result_rows, suffix_key))]
+    ref_arts = _column(ref_items[:min_len], ref_art_key)
+
+    table = _ART_DEL_SLASH if ignore_slash else _ART_DEL
+    # Сначала только номера расходящихся строк; записи строим для тех, что вернем
+    mismatched = [
+        i for i, (result_art, ref_art) in enumerate(zip(result_arts, ref_arts))
+        if result_art.translate(table) != ref_art.translate(table)
+    ]
+    errors = [
+        {'row': i + 1, 'result': result_arts[i], 'reference': ref_arts[i]}
+        for i in mismatched[:max_errors]
+    ]
+
+    return {
+        'total_rows': min_len,
+        'errors_count': len(mismatched),
+        'errors': errors,
+        'suffix_key': suffix_key
+    }
@@ -5,6 +5,90 @@ from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Any
 
+# Опциональный импорт ijson (потоковый парсинг больших JSON)
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+    ijson = None
+
+# Десятичная запятая -> точка для float()
+_COMMA_TO_DOT = str.maketrans({',': '.'})
+
+# Ветки JSON, которые реально участвуют в сравнении
+COMPARED_PATHS = ('document_info', 'parties', 'table_data.line_items')
+
+
+def _load_full(path: Path) -> Dict[str, Any]:
+    """Полная загрузка JSON и отбор только сравниваемых веток"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    result = {k: data[k] for k in ('document_info', 'parties') if k in data}
+    table_data = data.get('table_data')
+    if isinstance(table_data, dict) and 'line_items' in table_data:
+        result['table_data'] = {'line_items': table_data['line_items']}
+    return result
+
+
+def _list_json_files(directory: Path) -> List[Path]:
+    """Список JSON файлов директории за один проход os.scandir"""
+    with os.scandir(directory) as entries:
+        return [Path(e.path) for e in entries if e.is_file() and e.name.endswith('.json')]
+
+
+def load_comparison_data(path: Path) -> Dict[str, Any]:
+    """
+    Загружает из JSON только ветки, нужные для compare_jsons
+
+    При наличии ijson файл читается потоково, и в памяти собираются только
+    document_info, parties и table_data.line_items. Без ijson (или при ошибке
+    потокового парсинга) используется обычный json.load.
+
+    Args:
+        path: Путь к JSON файлу
+
+    Returns:
+        Словарь с document_info, parties и table_data.line_items
+    """
+    if not IJSON_AVAILABLE:
+        return _load_full(path)
+
+    found = {}
+    builder = None
+    current = None
+    depth = 0
+
+    try:
+        with open(path, 'rb') as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if builder is None:
+                    if prefix not in COMPARED_PATHS or event == 'map_key':
+                        continue
+                    builder = ijson.ObjectBuilder()
+                    current = prefix
+                    depth = 0
+
+                builder.event(event, value)
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+
+                if depth == 0:
+                    found[current] = builder.value
+                    builder = None
+                    if len(found) == len(COMPARED_PATHS):
+                        break
+    except Exception:
+        return _load_full(path)
+
+    result = {k: found[k] for k in ('document_info', 'parties') if k in found}
+    if 'table_data.line_items' in found:
+        result['table_data'] = {'line_items': found['table_data.line_items']}
+    return result
+
 # Импортируем вашу функцию сравнения (я её немного адаптирую)
 def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[str]:
     diffs = []
@@ -14,6 +98,10 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[str]:
         prog_data.pop(k, None)
         chat_data.pop(k, None)
 
+    # Полностью совпадающие документы не требуют обхода по полям
+    if prog_data == chat_data:
+        return diffs
+
     # 1. Document Info
     p_doc = prog_data.get('document_info', {})
     c_doc = chat_data.get('document_info', {})
@@ -54,14 +142,18 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[str]:
         if val_p_clean != val_c_clean:
              diffs.append(f"[{filename}] ROW {i+1} ARTICLE mismatch: PROG='{val_p}' vs CHAT='{val_c}'")
 
-        # Сравнение количества
-        qty_p = str(p_items[i].get(p_qty_key, '')).split()[0] # берем только число
-        qty_c = str(c_items[i].get(c_qty_key, '')).split()[0]
+        # Сравнение количества (берем только число)
+        qty_p = next(iter(str(p_items[i].get(p_qty_key, '')).split()), '')
+        qty_c = next(iter(str(c_items[i].get(c_qty_key, '')).split()), '')
+
+        # Одинаковые строки — сравнивать как числа не нужно
+        if qty_p == qty_c:
+            continue
 
         try:
-            if float(qty_p.replace(',', '.')) != float(qty_c.replace(',', '.')):
+            if float(qty_p.translate(_COMMA_TO_DOT)) != float(qty_c.translate(_COMMA_TO_DOT)):
                 diffs.append(f"[{filename}] ROW {i+1} QTY mismatch: PROG='{qty_p}' vs CHAT='{qty_c}'")
-        except:
+        except ValueError:
             pass # Если не числа, пропускаем
 
     return diffs
@@ -85,8 +177,8 @@ def main():
 
     # Находим общие файлы (предполагаем, что имена совпадают или похожи)
     # Для простоты ищем файлы, где имя файла из чата содержится в имени файла программы или наоборот
-    prog_files = list(prog_path.glob("*.json"))
-    chat_files = list(chat_path.glob("*.json"))
+    prog_files = _list_json_files(prog_path)
+    chat_files = _list_json_files(chat_path)
 
     matched_pairs = []
 
@@ -111,10 +203,8 @@ def main():
     for prog_f, chat_f in matched_pairs:
         report_lines.append(f"\n## 📄 {prog_f.name}")
         try:
-            with open(prog_f, 'r', encoding='utf-8') as f:
-                p_data = json.load(f)
-            with open(chat_f, 'r', encoding='utf-8') as f:
-                c_data = json.load(f)
+            p_data = load_comparison_data(prog_f)
+            c_data = load_comparison_data(chat_f)
 
             diffs = compare_jsons(p_data, c_data, prog_f.name)
 
@@ -132,8 +222,7 @@ def main():
     report_lines.append("\n---")
     report_lines.append(f"**Всего отличий по всем файлам: {total_diffs}**")
 
-    with open(args.report, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(report_lines))
+    Path(args.report).write_text('\n'.join(report_lines), encoding='utf-8')
 
     print(f"Отчет готов: {args.report}")
 
@@ -2,18 +2,25 @@
 """
 Батч-обработка документов из INVOICES_DIR с сравнением с эталонами
 """
+import io
+import os
+import re
 import sys
 import json
+import queue
+import asyncio
 import logging
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 
 # Добавляем путь к модулям
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from invoiceparser.core.config import Config
 from invoiceparser.services.orchestrator import Orchestrator
+from batch_compare import load_comparison_data
 
 # Настройка логирования
 logging.basicConfig(
@@ -22,6 +29,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger("batch_process")
 
+# Детектор ключа артикула ('art' покрывает и 'article')
+_ART_RE = re.compile(r'art', re.I)
+
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.bmp'})
+
+# Сколько готовых результатов может ждать сравнения
+RESULT_QUEUE_SIZE = 8
+
+
+class Diff(NamedTuple):
+    """Запись об одном различии между результатом и эталоном"""
+    type: str
+    field: str
+    program: Any
+    reference: Any
+    description: str
+
 
 def find_reference_file(invoice_name: str, examples_dir: Path) -> Optional[Path]:
     """
@@ -50,7 +74,7 @@ def find_reference_file(invoice_name: str, examples_dir: Path) -> Optional[Path]
     return None
 
 
-def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[str, Any]]:
+def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Diff]:
     """
     Умное сравнение двух JSON файлов
 
@@ -69,33 +93,37 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
         prog_data.pop(k, None)
         chat_data.pop(k, None)
 
+    # Полностью совпадающие документы не требуют обхода по полям
+    if prog_data == chat_data:
+        return diffs
+
     # 1. Document Info
     p_doc = prog_data.get('document_info', {})
     c_doc = chat_data.get('document_info', {})
 
-    for k in set(p_doc.keys()) | set(c_doc.keys()):
+    for k in p_doc.keys() | c_doc.keys():
         v1, v2 = p_doc.get(k), c_doc.get(k)
         if v1 != v2:
-            diffs.append({
-                'type': 'document_info',
-                'field': k,
-                'program': v1,
-                'reference': v2,
-                'description': f"document_info.{k}: '{v1}' vs '{v2}'"
-            })
+            diffs.append(Diff(
+                type='document_info',
+                field=k,
+                program=v1,
+                reference=v2,
+                description=f"document_info.{k}: '{v1}' vs '{v2}'"
+            ))
 
     # 2. Parties structure
     p_parties = prog_data.get('parties', {})
     c_parties = chat_data.get('parties', {})
 
-    if set(p_parties.keys()) != set(c_parties.keys()):
-        diffs.append({
-            'type': 'parties_structure',
-            'field': 'roles',
-            'program': list(p_parties.keys()),
-            'reference': list(c_parties.keys()),
-            'description': f"Different party roles: {list(p_parties.keys())} vs {list(c_parties.keys())}"
-        })
+    if p_parties.keys() != c_parties.keys():
+        diffs.append(Diff(
+            type='parties_structure',
+            field='roles',
+            program=list(p_parties.keys()),
+            reference=list(c_parties.keys()),
+            description=f"Different party roles: {list(p_parties.keys())} vs {list(c_parties.keys())}"
+        ))
 
     # Сравниваем customer (если есть)
     if 'customer' in p_parties and 'customer' in c_parties:
@@ -103,43 +131,43 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
         c_cust = c_parties['customer']
         for k in ['address', 'bank', 'name', 'edrpou', 'ipn']:
             if p_cust.get(k) != c_cust.get(k):
-                diffs.append({
-                    'type': 'parties_customer',
-                    'field': k,
-                    'program': p_cust.get(k),
-                    'reference': c_cust.get(k),
-                    'description': f"parties.customer.{k}: differs"
-                })
+                diffs.append(Diff(
+                    type='parties_customer',
+                    field=k,
+                    program=p_cust.get(k),
+                    reference=c_cust.get(k),
+                    description=f"parties.customer.{k}: differs"
+                ))
 
     # 3. Table Items
     p_items = prog_data.get('table_data', {}).get('line_items', [])
     c_items = chat_data.get('table_data', {}).get('line_items', [])
 
     if len(p_items) != len(c_items):
-        diffs.append({
-            'type': 'table_count',
-            'field': 'line_items',
-            'program': len(p_items),
-            'reference': len(c_items),
-            'description': f"Row count: {len(p_items)} vs {len(c_items)}"
-        })
+        diffs.append(Diff(
+            type='table_count',
+            field='line_items',
+            program=len(p_items),
+            reference=len(c_items),
+            description=f"Row count: {len(p_items)} vs {len(c_items)}"
+        ))
 
     # Сравниваем структуру колонок
     if p_items and c_items:
-        p_cols = set(p_items[0].keys())
-        c_cols = set(c_items[0].keys())
+        p_cols = p_items[0].keys()
+        c_cols = c_items[0].keys()
         if p_cols != c_cols:
-            diffs.append({
-                'type': 'table_structure',
-                'field': 'column_names',
-                'program': list(p_cols),
-                'reference': list(c_cols),
-                'description': f"Different column structure: {list(p_cols)} vs {list(c_cols)}"
-            })
+            diffs.append(Diff(
+                type='table_structure',
+                field='column_names',
+                program=list(p_cols),
+                reference=list(c_cols),
+                description=f"Different column structure: {list(p_cols)} vs {list(c_cols)}"
+            ))
 
         # Сравниваем артикулы (находим ключ для артикула)
-        p_art_key = next((k for k in p_items[0].keys() if 'article' in k.lower() or 'art' in k.lower()), None)
-        c_art_key = next((k for k in c_items[0].keys() if 'article' in k.lower() or 'art' in k.lower()), None)
+        p_art_key = next((k for k in p_items[0] if _ART_RE.search(k)), None)
+        c_art_key = next((k for k in c_items[0] if _ART_RE.search(k)), None)
 
         if p_art_key and c_art_key:
             art_diffs = 0
@@ -153,13 +181,13 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
 
                 if val_p_clean != val_c_clean:
                     art_diffs += 1
-                    diffs.append({
-                        'type': 'table_article',
-                        'field': f'row_{i+1}',
-                        'program': val_p,
-                        'reference': val_c,
-                        'description': f"Row {i+1} article mismatch: '{val_p}' vs '{val_c}'"
-                    })
+                    diffs.append(Diff(
+                        type='table_article',
+                        field=f'row_{i+1}',
+                        program=val_p,
+                        reference=val_c,
+                        description=f"Row {i+1} article mismatch: '{val_p}' vs '{val_c}'"
+                    ))
 
             if art_diffs > 0:
                 logger.warning(f"{filename}: Found {art_diffs} article mismatches")
@@ -167,8 +195,167 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
     return diffs
 
 
+def _produce_results(
+    orchestrator: Orchestrator,
+    invoice_files: List[Path],
+    examples_dir: Optional[Path],
+    done_q: "queue.Queue[Optional[Tuple[Path, Optional[Path], Dict[str, Any]]]]"
+) -> None:
+    """
+    Поток-производитель: обрабатывает документы и кладет результаты в очередь
+
+    Все документы обрабатываются в одном event loop, чтобы соединения БД
+    оркестратора не переходили между циклами. По завершении в очередь
+    кладется None.
+
+    Args:
+        orchestrator: Оркестратор обработки
+        invoice_files: Файлы для обработки
+        examples_dir: Директория с эталонами (или None)
+        done_q: Очередь (файл, эталон, результат) для потребителя
+    """
+    async def run():
+        for i, invoice_file in enumerate(invoice_files, 1):
+            logger.info(f"\n{'='*60}")
+            logger.info(f"[{i}/{len(invoice_files)}] Processing: {invoice_file.name}")
+            logger.info(f"{'='*60}")
+
+            reference_file = None
+            try:
+                # Ищем эталонный файл
+                if examples_dir:
+                    reference_file = find_reference_file(invoice_file.stem, examples_dir)
+                    if reference_file:
+                        logger.info(f"Found reference: {reference_file.name}")
+                    else:
+                        logger.info("No reference file found")
+
+                # Обработка документа
+                result = await orchestrator.process_document(invoice_file, compare_with=reference_file)
+            except Exception as e:
+                logger.error(f"Unexpected error processing {invoice_file.name}: {e}", exc_info=True)
+                result = {"success": False, "error": str(e)}
+
+            done_q.put((invoice_file, reference_file, result))
+
+    try:
+        asyncio.run(run())
+    finally:
+        done_q.put(None)
+
+
+def _consume_results(
+    done_q: "queue.Queue[Optional[Tuple[Path, Optional[Path], Dict[str, Any]]]]",
+    output_dir: Path,
+    report: Dict[str, Any],
+    sidecar_path: Path,
+    errors: List[Exception]
+) -> None:
+    """
+    Поток-потребитель: сравнивает результаты с эталонами и наполняет отчет
+
+    Записи сравнений не копятся в памяти: каждая дописывается строкой в
+    JSONL-файл, в отчете остаются только счетчики. Если сам потребитель
+    падает (например, не открылся JSONL-файл), ошибка попадает в errors, а
+    очередь дочитывается до None, чтобы производитель не блокировался.
+
+    Args:
+        done_q: Очередь (файл, эталон, результат) от производителя
+        output_dir: Директория результатов
+        report: Отчет, в который добавляются записи
+        sidecar_path: JSONL-файл для записей сравнений
+        errors: Список, куда записывается ошибка потребителя
+    """
+    finished = False
+    try:
+        with open(sidecar_path, 'a', encoding='utf-8') as sidecar:
+            while True:
+                item = done_q.get()
+                if item is None:
+                    finished = True
+                    break
+
+                invoice_file, reference_file, result = item
+                try:
+                    if not result.get("success"):
+                        error_msg = result.get("error", "Unknown error")
+                        logger.error(f"Failed: {error_msg}")
+                        report['failed'].append({
+                            'file': invoice_file.name,
+                            'error': error_msg
+                        })
+                        continue
+
+                    # Получаем путь к сохраненному файлу
+                    output_file = result.get("output_file")
+                    if output_file:
+                        output_path = Path(output_file)
+                    else:
+                        # Если файл не был сохранен автоматически, сохраняем вручную
+                        output_path = output_dir / f"{invoice_file.stem}_result.json"
+
+                    logger.info(f"✅ Saved to: {output_path.name}")
+
+                    # Сравнение с эталоном (если есть)
+                    differences_count = None
+                    if reference_file:
+                        try:
+                            prog_data = load_comparison_data(output_path)
+                            ref_data = load_comparison_data(reference_file)
+
+                            diffs = compare_jsons(prog_data, ref_data, invoice_file.name)
+
+                            comparison = {
+                                'file': invoice_file.name,
+                                'reference': reference_file.name,
+                                'differences_count': len(diffs),
+                                'differences': [d._asdict() for d in diffs[:20]]  # Первые 20 для отчета
+                            }
+
+                            if diffs:
+                                logger.warning(f"⚠️  {invoice_file.name}: found {len(diffs)} differences")
+                            else:
+                                logger.info(f"✅ {invoice_file.name}: perfect match!")
+
+                            sidecar.write(json.dumps(comparison, ensure_ascii=False) + '\n')
+                            sidecar.flush()
+
+                            differences_count = len(diffs)
+                            report['comparisons_count'] += 1
+                            report['diff_count_total'] += differences_count
+                            if diffs:
+                                report['files_with_diffs'].append(invoice_file.name)
+
+                        except Exception as e:
+                            logger.error(f"Comparison error: {e}")
+
+                    report['processed'].append({
+                        'file': invoice_file.name,
+                        'output': str(output_path),
+                        'elapsed_time': result.get("elapsed_time", 0),
+                        'differences_count': differences_count
+                    })
+
+                except Exception as e:
+                    logger.error(f"Unexpected error processing {invoice_file.name}: {e}", exc_info=True)
+                    report['failed'].append({
+                        'file': invoice_file.name,
+                        'error': str(e)
+                    })
+
+    except Exception as e:
+        logger.error(f"Result consumer failed: {e}", exc_info=True)
+        errors.append(e)
+        # Дочитываем очередь до None, иначе производитель зависнет на put
+        if not finished:
+            while done_q.get() is not None:
+                pass
+
+
 def process_batch():
     """Обработка всех файлов из INVOICES_DIR"""
+    # Единое время запуска: метка отчета и имена обоих файлов отчета
+    run_start = datetime.now()
 
     # Инициализация
     try:
@@ -191,11 +378,12 @@ def process_batch():
         examples_dir = None
 
     # Находим все файлы для обработки
-    supported_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.bmp']
-    invoice_files = []
-    for ext in supported_extensions:
-        invoice_files.extend(invoices_dir.glob(f"*{ext}"))
-        invoice_files.extend(invoices_dir.glob(f"*{ext.upper()}"))
+    # Один проход по директории вместо glob на каждое расширение
+    with os.scandir(invoices_dir) as entries:
+        invoice_files = [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+        ]
 
     if not invoice_files:
         logger.warning(f"No files found in {invoices_dir}")
@@ -203,138 +391,88 @@ def process_batch():
 
     logger.info(f"Found {len(invoice_files)} file(s) to process")
 
-    # Отчет
+    # Отчет (записи сравнений пишутся в JSONL рядом с отчетом)
+    ts = run_start.strftime('%Y%m%d_%H%M%S')
+    sidecar_path = output_dir / f"batch_report_{ts}.jsonl"
     report = {
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': run_start.isoformat(),
         'model': config.gemini_model,
         'total_files': len(invoice_files),
         'processed': [],
         'failed': [],
-        'comparisons': []
+        'comparisons_file': sidecar_path.name,
+        'comparisons_count': 0,
+        'diff_count_total': 0,
+        'files_with_diffs': []
     }
 
-    # Обработка каждого файла
-    for i, invoice_file in enumerate(invoice_files, 1):
-        logger.info(f"\n{'='*60}")
-        logger.info(f"[{i}/{len(invoice_files)}] Processing: {invoice_file.name}")
-        logger.info(f"{'='*60}")
-
-        try:
-            # Ищем эталонный файл
-            reference_file = None
-            if examples_dir:
-                reference_file = find_reference_file(invoice_file.stem, examples_dir)
-                if reference_file:
-                    logger.info(f"Found reference: {reference_file.name}")
-                else:
-                    logger.info("No reference file found")
-
-            # Обработка документа
-            result = orchestrator.process_document(invoice_file, compare_with=reference_file)
-
-            if not result.get("success"):
-                error_msg = result.get("error", "Unknown error")
-                logger.error(f"Failed: {error_msg}")
-                report['failed'].append({
-                    'file': invoice_file.name,
-                    'error': error_msg
-                })
-                continue
-
-            # Получаем путь к сохраненному файлу
-            output_file = result.get("output_file")
-            if output_file:
-                output_path = Path(output_file)
-            else:
-                # Если файл не был сохранен автоматически, сохраняем вручную
-                output_path = output_dir / f"{invoice_file.stem}_result.json"
-
-            logger.info(f"✅ Saved to: {output_path.name}")
-
-            # Сравнение с эталоном (если есть)
-            comparison = None
-            if reference_file:
-                try:
-                    with open(output_path, 'r', encoding='utf-8') as f:
-                        prog_data = json.load(f)
-                    with open(reference_file, 'r', encoding='utf-8') as f:
-                        ref_data = json.load(f)
-
-                    diffs = compare_jsons(prog_data, ref_data, invoice_file.name)
+    # Конвейер: поток-производитель обрабатывает документы (сеть/Gemini),
+    # поток-потребитель параллельно сравнивает готовые результаты с эталонами
+    done_q = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+    producer = threading.Thread(
+        target=_produce_results,
+        args=(orchestrator, invoice_files, examples_dir, done_q),
+        name="batch-producer"
+    )
+    consumer_errors: List[Exception] = []
+    consumer = threading.Thread(
+        target=_consume_results,
+        args=(done_q, output_dir, report, sidecar_path, consumer_errors),
+        name="batch-consumer"
+    )
+    producer.start()
+    consumer.start()
+    producer.join()
+    consumer.join()
+
+    if consumer_errors:
+        logger.error(f"Result processing failed: {consumer_errors[0]}")
+        sys.exit(1)
 
-                    comparison = {
-                        'file': invoice_file.name,
-                        'reference': reference_file.name,
-                        'differences_count': len(diffs),
-                        'differences': diffs[:20]  # Первые 20 для отчета
-                    }
+    # Сохранение отчета (JSON и MD с общей меткой времени)
+    report_path = output_dir / f"batch_report_{ts}.json"
+    report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    # Создание текстового отчета (собираем в буфере и пишем одним вызовом)
+    report_txt_path = output_dir / f"batch_report_{ts}.md"
+    buf = io.StringIO()
+    buf.write("# Batch Processing Report\n\n")
+    buf.write(f"**Date:** {run_start.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    buf.write(f"**Model:** {config.gemini_model}\n")
+    buf.write(f"**Total files:** {len(invoice_files)}\n")
+    buf.write(f"**Processed:** {len(report['processed'])}\n")
+    buf.write(f"**Failed:** {len(report['failed'])}\n\n")
+
+    buf.write("## Processed Files\n\n")
+    # Записи в JSONL идут в том же порядке, что и processed с differences_count
+    with open(sidecar_path, 'r', encoding='utf-8') as sidecar:
+        for item in report['processed']:
+            buf.write(f"### {item['file']}\n")
+            buf.write(f"- Output: `{item['output']}`\n")
+            buf.write(f"- Time: {item['elapsed_time']:.2f}s\n")
+            if item['differences_count'] is not None:
+                comp = json.loads(sidecar.readline())
+                buf.write(f"- **Differences: {comp['differences_count']}**\n")
+                if comp['differences']:
+                    buf.write("  - " + "\n  - ".join([d['description'] for d in comp['differences'][:10]]) + "\n")
+            buf.write("\n")
 
-                    if diffs:
-                        logger.warning(f"⚠️  Found {len(diffs)} differences")
-                    else:
-                        logger.info("✅ Perfect match!")
+    if report['failed']:
+        buf.write("## Failed Files\n\n")
+        for item in report['failed']:
+            buf.write(f"- **{item['file']}**: {item['error']}\n")
+        buf.write("\n")
 
-                    report['comparisons'].append(comparison)
+    # Сводка по сравнениям
+    if report['comparisons_count']:
+        buf.write("## Comparison Summary\n\n")
+        buf.write(f"**Total differences across all files: {report['diff_count_total']}**\n\n")
 
-                except Exception as e:
-                    logger.error(f"Comparison error: {e}")
-
-            report['processed'].append({
-                'file': invoice_file.name,
-                'output': str(output_path),
-                'elapsed_time': result.get("elapsed_time", 0),
-                'comparison': comparison
-            })
-
-        except Exception as e:
-            logger.error(f"Unexpected error processing {invoice_file.name}: {e}", exc_info=True)
-            report['failed'].append({
-                'file': invoice_file.name,
-                'error': str(e)
-            })
-
-    # Сохранение отчета
-    report_path = output_dir / f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(report_path, 'w', encoding='utf-8') as f:
-        json.dump(report, f, ensure_ascii=False, indent=2)
-
-    # Создание текстового отчета
-    report_txt_path = output_dir / f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-    with open(report_txt_path, 'w', encoding='utf-8') as f:
-        f.write(f"# Batch Processing Report\n\n")
-        f.write(f"**Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"**Model:** {config.gemini_model}\n")
-        f.write(f"**Total files:** {len(invoice_files)}\n")
-        f.write(f"**Processed:** {len(report['processed'])}\n")
-        f.write(f"**Failed:** {len(report['failed'])}\n\n")
-
-        f.write("## Processed Files\n\n")
         for item in report['processed']:
-            f.write(f"### {item['file']}\n")
-            f.write(f"- Output: `{item['output']}`\n")
-            f.write(f"- Time: {item['elapsed_time']:.2f}s\n")
-            if item.get('comparison'):
-                comp = item['comparison']
-                f.write(f"- **Differences: {comp['differences_count']}**\n")
-                if comp['differences']:
-                    f.write("  - " + "\n  - ".join([d['description'] for d in comp['differences'][:10]]) + "\n")
-            f.write("\n")
-
-        if report['failed']:
-            f.write("## Failed Files\n\n")
-            for item in report['failed']:
-                f.write(f"- **{item['file']}**: {item['error']}\n")
-            f.write("\n")
-
-        # Сводка по сравнениям
-        if report['comparisons']:
-            f.write("## Comparison Summary\n\n")
-            total_diffs = sum(c['differences_count'] for c in report['comparisons'])
-            f.write(f"**Total differences across all files: {total_diffs}**\n\n")
-
-            for comp in report['comparisons']:
-                if comp['differences_count'] > 0:
-                    f.write(f"- **{comp['file']}**: {comp['differences_count']} differences\n")
+            if item['differences_count']:
+                buf.write(f"- **{item['file']}**: {item['differences_count']} differences\n")
+
+    report_txt_path.write_text(buf.getvalue(), encoding='utf-8')
 
     logger.info(f"\n{'='*60}")
     logger.info(f"✅ Batch processing completed!")
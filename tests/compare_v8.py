@@ -4,8 +4,9 @@
 """
 import json
 import logging
+import re
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, NamedTuple
 
 # Настройка логирования
 logging.basicConfig(
@@ -14,7 +15,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger("compare_v8")
 
-def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[str, Any]]:
+# Детекторы ключей колонок (синонимы артикула и цены)
+_ART_RE = re.compile(r'article|sku|item_code|product_code', re.I)
+_PRICE_RE = re.compile(r'price', re.I)
+_TOTAL_RE = re.compile(r'total', re.I)
+
+# Нормализация цены для float(): запятая -> точка, без пробелов
+_PRICE_TRANS = str.maketrans({',': '.', ' ': None})
+
+class Diff(NamedTuple):
+    """Запись об одном различии между результатом и эталоном"""
+    type: str
+    field: str
+    program: Any
+    reference: Any
+    description: str
+
+def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Diff]:
     diffs = []
 
     # Убираем метаданные
@@ -39,13 +56,13 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
             continue
 
         if v1 != v2:
-            diffs.append({
-                'type': 'document_info',
-                'field': k,
-                'program': v1,
-                'reference': v2,
-                'description': f"document_info.{k}: '{v1}' vs '{v2}'"
-            })
+            diffs.append(Diff(
+                type='document_info',
+                field=k,
+                program=v1,
+                reference=v2,
+                description=f"document_info.{k}: '{v1}' vs '{v2}'"
+            ))
 
     # 2. Parties
     # Тут сложнее, так как ключи ролей могут быть разными (supplier vs seller)
@@ -54,26 +71,26 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
     # Проверяем наличие _label (это требование v8)
     for role, data in prog_data.get('parties', {}).items():
         if isinstance(data, dict) and '_label' not in data:
-             diffs.append({
-                'type': 'v8_compliance',
-                'field': f'parties.{role}._label',
-                'program': 'MISSING',
-                'reference': 'REQUIRED',
-                'description': f"Party '{role}' is missing '_label' field"
-            })
+             diffs.append(Diff(
+                type='v8_compliance',
+                field=f'parties.{role}._label',
+                program='MISSING',
+                reference='REQUIRED',
+                description=f"Party '{role}' is missing '_label' field"
+            ))
 
     # 3. Table Items
     p_items = prog_data.get('table_data', {}).get('line_items', [])
     c_items = chat_data.get('table_data', {}).get('line_items', [])
 
     if len(p_items) != len(c_items):
-        diffs.append({
-            'type': 'table_count',
-            'field': 'line_items',
-            'program': len(p_items),
-            'reference': len(c_items),
-            'description': f"Row count: {len(p_items)} vs {len(c_items)}"
-        })
+        diffs.append(Diff(
+            type='table_count',
+            field='line_items',
+            program=len(p_items),
+            reference=len(c_items),
+            description=f"Row count: {len(p_items)} vs {len(c_items)}"
+        ))
 
     # Сравниваем структуру колонок
     if p_items and c_items:
@@ -87,12 +104,12 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
         min_len = min(len(p_items), len(c_items))
 
         # Пытаемся найти ключ артикула (синонимы: article, sku, item_code)
-        p_art = next((k for k in p_items[0] if any(x in k.lower() for x in ['article', 'sku', 'item_code', 'product_code'])), None)
-        c_art = next((k for k in c_items[0] if any(x in k.lower() for x in ['article', 'sku', 'item_code', 'product_code'])), None)
+        p_art = next((k for k in p_items[0] if _ART_RE.search(k)), None)
+        c_art = next((k for k in c_items[0] if _ART_RE.search(k)), None)
 
         # Пытаемся найти ключ цены (синонимы: price, unit_price, price_no_vat)
-        p_price = next((k for k in p_items[0] if 'price' in k.lower() and 'total' not in k.lower()), None)
-        c_price = next((k for k in c_items[0] if 'price' in k.lower() and 'total' not in k.lower()), None)
+        p_price = next((k for k in p_items[0] if _PRICE_RE.search(k) and not _TOTAL_RE.search(k)), None)
+        c_price = next((k for k in c_items[0] if _PRICE_RE.search(k) and not _TOTAL_RE.search(k)), None)
 
         for i in range(min_len):
             # Артикул
@@ -104,29 +121,36 @@ def compare_jsons(prog_data: Dict, chat_data: Dict, filename: str) -> List[Dict[
             val_c_clean = val_c.replace('.', '').replace('-', '').replace('/', '')
 
             if val_p_clean != val_c_clean:
-                diffs.append({
-                    'type': 'table_value',
-                    'field': f'row_{i+1}.article',
-                    'program': val_p,
-                    'reference': val_c,
-                    'description': f"Row {i+1} article: '{val_p}' vs '{val_c}'"
-                })
+                diffs.append(Diff(
+                    type='table_value',
+                    field=f'row_{i+1}.article',
+                    program=val_p,
+                    reference=val_c,
+                    description=f"Row {i+1} article: '{val_p}' vs '{val_c}'"
+                ))
 
             # Цена (только если есть в обоих)
             if p_price in p_items[i] and c_price in c_items[i]:
+                raw_p = str(p_items[i][p_price])
+                raw_c = str(c_items[i][c_price])
+
+                # Одинаковые строки — сравнивать как числа не нужно
+                if raw_p == raw_c:
+                    continue
+
                 # Простая проверка: числа должны совпадать
                 try:
-                    pr_p = float(str(p_items[i][p_price]).replace(',', '.').replace(' ', ''))
-                    pr_c = float(str(c_items[i][c_price]).replace(',', '.').replace(' ', ''))
+                    pr_p = float(raw_p.translate(_PRICE_TRANS))
+                    pr_c = float(raw_c.translate(_PRICE_TRANS))
                     if abs(pr_p - pr_c) > 0.01:
-                         diffs.append({
-                            'type': 'table_value',
-                            'field': f'row_{i+1}.price',
-                            'program': pr_p,
-                            'reference': pr_c,
-                            'description': f"Row {i+1} price: {pr_p} vs {pr_c}"
-                        })
-                except:
+                         diffs.append(Diff(
+                            type='table_value',
+                            field=f'row_{i+1}.price',
+                            program=pr_p,
+                            reference=pr_c,
+                            description=f"Row {i+1} price: {pr_p} vs {pr_c}"
+                        ))
+                except ValueError:
                     pass
 
     return diffs
@@ -167,7 +191,7 @@ def main():
                 print("   ✅ PERFECT MATCH")
             else:
                 for d in diffs:
-                    print(f"   ❌ {d['description']}")
+                    print(f"   ❌ {d.description}")
                 total_diffs += len(diffs)
 
         except Exception as e:
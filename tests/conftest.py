@@ -1,11 +1,18 @@
-"""Конфигурация pytest"""
+"""Конфигурация pytest
+
+Временные директории создает и чистит сам pytest (tmp_path/tmp_path_factory).
+Для I/O-тяжелых прогонов их можно держать в RAM (tmpfs):
+    TMPDIR=/dev/shm pytest tests
+"""
 import pytest
-from pathlib import Path
-import tempfile
-import shutil
+
 
 @pytest.fixture
-def temp_dir():
-    temp_path = Path(tempfile.mkdtemp())
-    yield temp_path
-    shutil.rmtree(temp_path)
+def temp_dir(tmp_path):
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def shared_temp(tmp_path_factory):
+    """Общая временная директория на всю сессию тестов"""
+    return tmp_path_factory.mktemp("shared")
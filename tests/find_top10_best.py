@@ -3,161 +3,434 @@
 Поиск 10 лучших файлов dnipromash по качеству данных
 Сравнение важных бизнес-полей с эталоном
 """
-import json
+import heapq
+import io
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
-
-def compare_business_fields(result_data: Dict, ref_data: Dict) -> Dict[str, Any]:
-    """Сравнивает важные бизнес-поля и возвращает статистику ошибок"""
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import orjson
+
+
+# Опциональный импорт ijson (потоковый разбор больших файлов)
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+    ijson = None
+
+# Файлы больше этого размера разбираются потоково (только line_items)
+STREAM_THRESHOLD_BYTES = 256 * 1024
+
+
+def _load(path: Path) -> Dict[str, Any]:
+    """Загружает JSON файл через orjson"""
+    return orjson.loads(path.read_bytes())
+
+
+def find_dnipromash_files(root: Path) -> Iterator[Path]:
+    """
+    Рекурсивно находит JSON файлы dnipromash (кроме *_merged)
+
+    Обход через os.scandir: фильтр по имени без stat() для каждого файла.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif 'dnipromash' in entry.name and entry.name.endswith('.json') and '_merged' not in entry.name:
+                    yield Path(entry.path)
+
+
+def _has_line_items(path: Path) -> bool:
+    """
+    Быстрая проверка до разбора JSON: есть ли в файле ключ line_items
+
+    Файлы без него сравнить нельзя, их тело не разбираем.
+    """
+    with path.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm.find(b'"line_items"') != -1
+
+
+def _load_items(path: Path) -> Dict[str, Any]:
+    """
+    Загружает из файла только table_data.line_items
+
+    Большие файлы читаются потоково через ijson, остальные ключи не
+    материализуются. Малые файлы (или без ijson) - целиком через orjson.
+    """
+    if IJSON_AVAILABLE and path.stat().st_size > STREAM_THRESHOLD_BYTES:
+        with path.open('rb') as f:
+            items = list(ijson.items(f, 'table_data.line_items.item', use_float=True))
+        return {'table_data': {'line_items': items}}
+
+    data = _load(path)
+    return {'table_data': {'line_items': data.get('table_data', {}).get('line_items', [])}}
+
+
+# Таблицы нормализации: артикул без пробелов/точек/дефисов,
+# числа с десятичной точкой и без разделителей
+_ART_DEL = str.maketrans('', '', ' .-')
+_PRICE_TR = str.maketrans({',': '.', ' ': None})
+_AMOUNT_TR = str.maketrans({',': '.', ' ': None, '"': None})
+_QTY_TR = str.maketrans({',': '.', ' ': None, '\xa0': None})
+_QTY_RE = re.compile(r'[-+]?\d*\.?\d+')
+
+# Грамматика строк, которые принимает float(): проверка заранее вместо
+# исключений на каждом нечисловом значении
+_DIGITS = r'\d(?:_?\d)*'
+_FLOAT_RE = re.compile(
+    r'\s*[-+]?(?:(?:' + _DIGITS + r'(?:\.(?:' + _DIGITS + r')?)?|\.' + _DIGITS + r')'
+    r'(?:[eE][-+]?' + _DIGITS + r')?|inf(?:inity)?|nan)\s*',
+    re.I
+)
+
+# Правила определения бизнес-ролей колонок, в порядке приоритета
+# (ключ получает первую подходящую роль, при нескольких ключах роли - последний)
+_RESULT_ROLE_RULES = (
+    ('article', re.compile(r'article|sku|item_code', re.I)),
+    ('price', re.compile(r'price', re.I)),
+    ('quantity', re.compile(r'quantity|qty', re.I)),
+    ('amount', re.compile(r'amount|sum|total', re.I)),
+)
+_REF_ROLE_RULES = (
+    ('article', re.compile(r'article|sku', re.I)),
+    ('price', re.compile(r'price', re.I)),
+    ('quantity', re.compile(r'quantity|qty', re.I)),
+    ('amount', re.compile(r'amount|sum|total', re.I)),
+)
+
+
+@lru_cache(maxsize=None)
+def _detect_role_keys(keys: Tuple[str, ...], rules: Tuple[Tuple[str, re.Pattern], ...]) -> Dict[str, str]:
+    """
+    Сопоставляет колонки строки таблицы бизнес-ролям
+
+    Результат кешируется по набору ключей: файлы с одинаковой схемой
+    разбираются один раз. Возвращаемый словарь изменять нельзя.
+    """
+    role_keys = {}
+    for k in keys:
+        for role, pattern in rules:
+            if pattern.search(k):
+                role_keys[role] = k
+                break
+    return role_keys
+
+
+def _parse_price(value: Any) -> Optional[float]:
+    text = str(value).translate(_PRICE_TR)
+    return float(text) if _FLOAT_RE.fullmatch(text) else None
+
+
+def _parse_quantity(value: Any) -> float:
+    # Извлекаем число из строки (например, "1 шт" -> 1, "1,5 шт" -> 1.5)
+    match = _QTY_RE.search(str(value).translate(_QTY_TR))
+    return float(match.group(0)) if match else 0.0
+
+
+def _parse_amount(value: Any) -> Optional[float]:
+    text = str(value).translate(_AMOUNT_TR)
+    return float(text) if _FLOAT_RE.fullmatch(text) else None
+
+
+def _parse_column(values: List[Any], parse) -> Tuple[np.ndarray, np.ndarray]:
+    """Разбирает колонку в float64 и маску успешно разобранных значений"""
+    parsed = np.zeros(len(values), dtype=np.float64)
+    ok = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        number = parse(value)
+        if number is not None:
+            parsed[i] = number
+            ok[i] = True
+    return parsed, ok
+
+
+@dataclass
+class RefColumn:
+    """Числовая колонка эталона, разобранная заранее"""
+    values: List[Any]
+    parsed: np.ndarray
+    ok: np.ndarray
+
+
+@dataclass
+class RefBundle:
+    """Эталон, подготовленный для сравнения с множеством файлов"""
+    rows: int
+    keys: Dict[str, str]
+    article: List[str] = field(default_factory=list)
+    article_clean: List[str] = field(default_factory=list)
+    numeric: Dict[str, RefColumn] = field(default_factory=dict)
+
+
+# Критичные строки таблицы (1, 8, 11), индексы с нуля
+CRITICAL_ROWS = (0, 7, 10)
+
+# Числовые роли и их парсеры
+_NUMERIC_ROLES = (('price', _parse_price), ('quantity', _parse_quantity), ('amount', _parse_amount))
+
+
+def build_ref_bundle(ref_data: Dict[str, Any]) -> RefBundle:
+    """Один раз нормализует и разбирает бизнес-колонки эталона"""
+    ref_items = ref_data.get('table_data', {}).get('line_items', [])
+    if not ref_items:
+        return RefBundle(rows=0, keys={})
+
+    ref_keys = _detect_role_keys(tuple(ref_items[0].keys()), _REF_ROLE_RULES)
+    bundle = RefBundle(rows=len(ref_items), keys=ref_keys)
+
+    if ref_keys.get('article'):
+        bundle.article = [str(row.get(ref_keys['article'], '')).strip() for row in ref_items]
+        bundle.article_clean = [value.translate(_ART_DEL) for value in bundle.article]
+
+    for role, parse in _NUMERIC_ROLES:
+        if ref_keys.get(role):
+            values = [row.get(ref_keys[role]) for row in ref_items]
+            parsed, ok = _parse_column(values, parse)
+            bundle.numeric[role] = RefColumn(values=values, parsed=parsed, ok=ok)
+
+    return bundle
+
+
+def _diff_mask(a: np.ndarray, b: np.ndarray, tol: float) -> np.ndarray:
+    """|a - b| > tol без промежуточных массивов (разность считается на месте)"""
+    with np.errstate(invalid='ignore'):
+        diff = np.subtract(a, b)
+        np.abs(diff, out=diff)
+        return np.greater(diff, tol)
+
+
+def _numeric_mask(result_values: List[Any], ref_column: RefColumn, parse) -> np.ndarray:
+    """
+    Маска строк, где числовая колонка расходится с эталоном больше чем на 0.01
+
+    Числовые строки сравниваются одной векторной операцией; строки, где
+    хотя бы одно значение не число, сравниваются как текст.
+    """
+    n = len(result_values)
+    ref_values = ref_column.values
+    result_parsed, result_ok = _parse_column(result_values, parse)
+
+    numeric = result_ok & ref_column.ok[:n]
+    bad = _diff_mask(result_parsed, ref_column.parsed[:n], 0.01)
+    bad &= numeric
+    for i in np.flatnonzero(~numeric):
+        bad[i] = str(result_values[i]).strip() != str(ref_values[i]).strip()
+
+    return bad
+
+
+def _columnize(items: List[Dict[str, Any]], role_keys: Dict[str, str], n: int) -> Dict[str, List[Any]]:
+    """
+    Один проход по первым n строкам: список значений для каждой роли
+
+    Все поля строки читаются за одно обращение к ней; append каждой колонки
+    связывается заранее, чтобы не искать колонку в словаре на каждой строке.
+    """
+    columns = {role: [] for role in role_keys}
+    fields = [
+        (columns[role].append, key, '' if role == 'article' else None)
+        for role, key in role_keys.items()
+    ]
+    for row in items[:n]:
+        get = row.get
+        for append, key, default in fields:
+            append(get(key, default))
+    return columns
+
+
+def compare_business_fields(
+    result_data: Dict,
+    ref_bundle: RefBundle,
+    result_keys: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Сравнивает важные бизнес-поля с подготовленным эталоном и возвращает статистику ошибок
+
+    Args:
+        result_data: Результат парсинга
+        ref_bundle: Подготовленный эталон
+        result_keys: Уже определенные роли колонок результата (если известны)
+    """
 
     result_items = result_data.get('table_data', {}).get('line_items', [])
-    ref_items = ref_data.get('table_data', {}).get('line_items', [])
 
-    if not result_items or not ref_items:
+    if not result_items or not ref_bundle.rows:
         return {'error': 'Empty items'}
 
-    # Находим ключи в результате
-    result_keys = {}
-    for k in result_items[0].keys():
-        k_lower = k.lower()
-        if any(x in k_lower for x in ['article', 'sku', 'item_code']):
-            result_keys['article'] = k
-        elif any(x in k_lower for x in ['price', 'unit_price', 'price_without', 'price_excl']):
-            result_keys['price'] = k
-        elif any(x in k_lower for x in ['quantity', 'qty']):
-            result_keys['quantity'] = k
-        elif any(x in k_lower for x in ['amount', 'sum', 'total', 'amount_without', 'total_without']):
-            result_keys['amount'] = k
-
-    # Находим ключи в эталоне
-    ref_keys = {}
-    for k in ref_items[0].keys():
-        k_lower = k.lower()
-        if any(x in k_lower for x in ['article', 'sku']):
-            ref_keys['article'] = k
-        elif any(x in k_lower for x in ['price', 'unit_price']):
-            ref_keys['price'] = k
-        elif any(x in k_lower for x in ['quantity', 'qty']):
-            ref_keys['quantity'] = k
-        elif any(x in k_lower for x in ['amount', 'sum', 'total']):
-            ref_keys['amount'] = k
-
-    min_len = min(len(result_items), len(ref_items))
-
-    errors = {
-        'article': [],
-        'price': [],
-        'quantity': [],
-        'amount': []
-    }
+    # Находим ключи в результате (ключи эталона уже в ref_bundle)
+    if result_keys is None:
+        result_keys = _detect_role_keys(tuple(result_items[0].keys()), _RESULT_ROLE_RULES)
+    ref_keys = ref_bundle.keys
+
+    min_len = min(len(result_items), ref_bundle.rows)
+
+    # Колонки, которые есть и в результате, и в эталоне - извлекаем за один проход
+    compared_keys = {role: key for role, key in result_keys.items() if ref_keys.get(role)}
+    columns = _columnize(result_items, compared_keys, min_len)
+
+    # Ошибки храним масками по строкам; записи строим только для критичных строк
+    masks = {role: np.zeros(min_len, dtype=bool) for role in ('article', 'price', 'quantity', 'amount')}
+    critical_article_errors = []
 
     # Сравниваем артикулы
-    if result_keys.get('article') and ref_keys.get('article'):
-        for i in range(min_len):
-            result_art = str(result_items[i].get(result_keys['article'], '')).strip()
-            ref_art = str(ref_items[i].get(ref_keys['article'], '')).strip()
-
-            result_clean = result_art.replace(' ', '').replace('.', '').replace('-', '')
-            ref_clean = ref_art.replace(' ', '').replace('.', '').replace('-', '')
-
-            if result_clean != ref_clean:
-                errors['article'].append({
-                    'row': i + 1,
-                    'result': result_art,
-                    'reference': ref_art
-                })
-
-    # Сравниваем цены
-    if result_keys.get('price') and ref_keys.get('price'):
-        for i in range(min_len):
-            result_price = result_items[i].get(result_keys['price'])
-            ref_price = ref_items[i].get(ref_keys['price'])
-
-            # Нормализуем цены
-            try:
-                result_val = float(str(result_price).replace(',', '.').replace(' ', ''))
-                ref_val = float(str(ref_price).replace(',', '.').replace(' ', ''))
-                if abs(result_val - ref_val) > 0.01:  # Допуск 0.01
-                    errors['price'].append({
-                        'row': i + 1,
-                        'result': result_price,
-                        'reference': ref_price
-                    })
-            except:
-                if str(result_price).strip() != str(ref_price).strip():
-                    errors['price'].append({
-                        'row': i + 1,
-                        'result': result_price,
-                        'reference': ref_price
-                    })
-
-    # Сравниваем количества
-    if result_keys.get('quantity') and ref_keys.get('quantity'):
-        for i in range(min_len):
-            result_qty = result_items[i].get(result_keys['quantity'])
-            ref_qty = ref_items[i].get(ref_keys['quantity'])
-
-            try:
-                # Извлекаем число из строки (например, "1 шт" -> 1)
-                result_val = float(''.join(filter(str.isdigit, str(result_qty).replace(',', '.'))) or '0')
-                ref_val = float(''.join(filter(str.isdigit, str(ref_qty).replace(',', '.'))) or '0')
-                if abs(result_val - ref_val) > 0.01:
-                    errors['quantity'].append({
-                        'row': i + 1,
-                        'result': result_qty,
-                        'reference': ref_qty
-                    })
-            except:
-                if str(result_qty).strip() != str(ref_qty).strip():
-                    errors['quantity'].append({
-                        'row': i + 1,
-                        'result': result_qty,
-                        'reference': ref_qty
-                    })
-
-    # Сравниваем суммы
-    if result_keys.get('amount') and ref_keys.get('amount'):
-        for i in range(min_len):
-            result_amt = result_items[i].get(result_keys['amount'])
-            ref_amt = ref_items[i].get(ref_keys['amount'])
-
-            try:
-                result_val = float(str(result_amt).replace(',', '.').replace(' ', '').replace('"', ''))
-                ref_val = float(str(ref_amt).replace(',', '.').replace(' ', '').replace('"', ''))
-                if abs(result_val - ref_val) > 0.01:
-                    errors['amount'].append({
-                        'row': i + 1,
-                        'result': result_amt,
-                        'reference': ref_amt
-                    })
-            except:
-                if str(result_amt).strip() != str(ref_amt).strip():
-                    errors['amount'].append({
-                        'row': i + 1,
-                        'result': result_amt,
-                        'reference': ref_amt
-                    })
-
-    total_errors = sum(len(errors[k]) for k in errors)
+    if 'article' in columns:
+        result_articles = [str(value).strip() for value in columns['article']]
+        masks['article'] = np.fromiter(
+            (art.translate(_ART_DEL) != ref_clean for art, ref_clean in zip(result_articles, ref_bundle.article_clean)),
+            dtype=bool,
+            count=min_len
+        )
+        critical_article_errors = [
+            {'row': i + 1, 'result': result_articles[i], 'reference': ref_bundle.article[i]}
+            for i in CRITICAL_ROWS if i < min_len and masks['article'][i]
+        ]
+
+    # Сравниваем цены, количества и суммы (векторно)
+    for role, parse in _NUMERIC_ROLES:
+        if role in columns:
+            masks[role] = _numeric_mask(columns[role], ref_bundle.numeric[role], parse)
+
+    counts = {role: int(mask.sum()) for role, mask in masks.items()}
+    total_errors = sum(counts.values())
 
     return {
         'total_rows': min_len,
-        'errors': errors,
+        'article_mask': masks['article'],
+        'price_mask': masks['price'],
+        'quantity_mask': masks['quantity'],
+        'amount_mask': masks['amount'],
+        'critical_article_errors': critical_article_errors,
         'total_errors': total_errors,
-        'article_errors': len(errors['article']),
-        'price_errors': len(errors['price']),
-        'quantity_errors': len(errors['quantity']),
-        'amount_errors': len(errors['amount']),
+        'article_errors': counts['article'],
+        'price_errors': counts['price'],
+        'quantity_errors': counts['quantity'],
+        'amount_errors': counts['amount'],
         'accuracy': (min_len * 4 - total_errors) / (min_len * 4) * 100 if min_len > 0 else 0
     }
 
+
+# Метки промптов в путях файлов (v6/v8/v9 без учета регистра), в порядке приоритета
+_PROMPT_RE = re.compile(r'(?i:v6|v8|v9)|0312|arch|0412|0512')
+_PROMPT_ORDER = ('v6', 'v8', 'v9', '0312', 'arch', '0412', '0512')
+_PROMPT_BY_TOKEN = {
+    'v6': "items_v6.txt",
+    'v8': "items_v8.txt",
+    'v9': "items_v9.txt",
+    '0312': "items_v6.txt (arch)",
+    'arch': "items_v6.txt (arch)",
+    '0412': "items_v7.txt (вероятно)",
+}
+
+# Эталон в процессе-обработчике (заполняется _init_worker)
+_worker_ref_bundle: Optional[RefBundle] = None
+
+
+def _init_worker(ref_bundle: RefBundle) -> None:
+    """
+    Инициализация процесса-обработчика
+
+    Эталон готовится один раз в родительском процессе. При fork процессы
+    получают его без копирования (copy-on-write), при spawn - одной
+    сериализацией на процесс, а не на каждую задачу.
+    """
+    global _worker_ref_bundle
+    _worker_ref_bundle = ref_bundle
+
+
+class Schema(NamedTuple):
+    """Классификация набора колонок line_items"""
+    role_keys: Dict[str, str]
+    structure_prompt: str
+
+
+@lru_cache(maxsize=None)
+def _classify_schema(keys: Tuple[str, ...]) -> Schema:
+    """
+    Роли колонок и промпт по структуре для набора ключей строки
+
+    Многие файлы имеют одинаковую схему, поэтому классификация кешируется
+    по кортежу ключей и выполняется один раз на схему.
+    """
+    if 'sku' in keys:
+        structure_prompt = "items_v8/v9.txt"
+    elif 'article_number' in keys:
+        structure_prompt = "items_v7.txt"
+    else:
+        structure_prompt = "unknown"
+
+    return Schema(_detect_role_keys(keys, _RESULT_ROLE_RULES), structure_prompt)
+
+
+def _detect_prompt(file_str: str, structure_prompt: str) -> str:
+    """Определяет промпт по имени файла или структуре (для файлов 0512)"""
+    # Один проход по имени; при нескольких метках побеждает первая по _PROMPT_ORDER
+    tokens = {token.lower() for token in _PROMPT_RE.findall(file_str)}
+    token = next((t for t in _PROMPT_ORDER if t in tokens), None)
+
+    if token is None:
+        return "unknown"
+
+    if token == "0512":
+        return structure_prompt
+
+    return _PROMPT_BY_TOKEN[token]
+
+
+def _analyze_file(task: Tuple[Path, str]) -> Optional[Dict[str, Any]]:
+    """
+    Загружает файл и сравнивает с эталоном (выполняется в процессе-обработчике)
+
+    task - пара (файл, префикс корня с разделителем); относительный путь
+    получается срезом строки без создания PurePath.
+    """
+    f, root = task
+    try:
+        if not _has_line_items(f):
+            return None
+
+        data = _load_items(f)
+
+        items = data['table_data']['line_items']
+        if not items:
+            return None
+
+        schema = _classify_schema(tuple(items[0].keys()))
+
+        comparison = compare_business_fields(data, _worker_ref_bundle, result_keys=schema.role_keys)
+
+        if 'error' in comparison:
+            return None
+
+        file_str = str(f)[len(root):]
+        return {
+            'file': file_str,
+            'prompt': _detect_prompt(file_str, schema.structure_prompt),
+            'comparison': comparison
+        }
+
+    except Exception:
+        return None
+
+
 def main():
     output_dir = Path("output")
     reference_file = Path("examples/gemini_thinking_2_prompts_v7/dnipromash_gemini_thinking_2_prompts_v7.json")
 
-    # Загружаем эталон
-    with open(reference_file, 'r', encoding='utf-8') as f:
-        ref_data = json.load(f)
+    # Эталон разбираем и готовим к сравнению один раз
+    ref_bundle = build_ref_bundle(_load(reference_file))
 
     print("=" * 80)
     print("ПОИСК 10 ЛУЧШИХ ФАЙЛОВ ПО КАЧЕСТВУ ДАННЫХ")
@@ -165,58 +438,20 @@ def main():
     print(f"\n📋 Эталон: {reference_file.name}")
     print()
 
-    # Находим все файлы dnipromash
-    all_files = list(output_dir.rglob("*dnipromash*.json"))
-
-    # Исключаем merged файлы
-    all_files = [f for f in all_files if '_merged' not in f.name]
+    # Находим все файлы dnipromash (без merged файлов)
+    all_files = list(find_dnipromash_files(output_dir))
 
     print(f"Найдено {len(all_files)} файлов для анализа\n")
 
+    # Файлы независимы: загрузка и сравнение идут параллельно в процессах,
+    # готовый эталон передается каждому процессу один раз через initializer
     results = []
-
-    for f in sorted(all_files):
-        try:
-            with open(f, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-
-            comparison = compare_business_fields(data, ref_data)
-
-            if 'error' in comparison:
-                continue
-
-            # Определяем промпт по имени файла или структуре
-            file_str = str(f.relative_to(output_dir))
-            prompt = "unknown"
-
-            if "v6" in file_str.lower():
-                prompt = "items_v6.txt"
-            elif "v8" in file_str.lower() or "_v8" in file_str.lower():
-                prompt = "items_v8.txt"
-            elif "v9" in file_str.lower() or "_v9" in file_str.lower():
-                prompt = "items_v9.txt"
-            elif "0312" in file_str or "arch" in file_str:
-                prompt = "items_v6.txt (arch)"
-            elif "0412" in file_str:
-                prompt = "items_v7.txt (вероятно)"
-            elif "0512" in file_str:
-                # По структуре определяем
-                items = data.get('table_data', {}).get('line_items', [])
-                if items:
-                    cols = list(items[0].keys())
-                    if 'sku' in cols:
-                        prompt = "items_v8/v9.txt"
-                    elif 'article_number' in cols:
-                        prompt = "items_v7.txt"
-
-            results.append({
-                'file': f.relative_to(output_dir),
-                'prompt': prompt,
-                'comparison': comparison
-            })
-
-        except Exception as e:
-            pass
+    with ProcessPoolExecutor(initializer=_init_worker, initargs=(ref_bundle,)) as executor:
+        root = str(output_dir) + os.sep
+        tasks = [(f, root) for f in all_files]
+        for result in executor.map(_analyze_file, tasks, chunksize=16):
+            if result is not None:
+                results.append(result)
 
     # Сортируем по общему количеству ошибок (приоритет артикулам)
     # Используем взвешенную оценку: артикулы важнее
@@ -225,41 +460,46 @@ def main():
         # Артикулы весят больше
         return comp['article_errors'] * 10 + comp['price_errors'] * 2 + comp['quantity_errors'] + comp['amount_errors']
 
-    results.sort(key=score)
+    # Нужны только 10 лучших: частичный отбор вместо полной сортировки,
+    # путь файла - детерминированный разрыв ничьих
+    top10 = heapq.nsmallest(10, results, key=lambda result: (score(result), result['file']))
 
-    print("=" * 80)
-    print("ТОП-10 ЛУЧШИХ ФАЙЛОВ")
-    print("=" * 80)
-    print()
+    # Отчет собираем в буфере и выводим одной записью
+    buf = io.StringIO()
 
-    for i, result in enumerate(results[:10], 1):
+    print("=" * 80, file=buf)
+    print("ТОП-10 ЛУЧШИХ ФАЙЛОВ", file=buf)
+    print("=" * 80, file=buf)
+    print(file=buf)
+
+    for i, result in enumerate(top10, 1):
         comp = result['comparison']
-        print(f"{i}. 📄 {result['file']}")
-        print(f"   Промпт: {result['prompt']}")
-        print(f"   Строк: {comp['total_rows']}")
-        print(f"   Ошибки:")
-        print(f"     • Артикулы: {comp['article_errors']} (критично)")
-        print(f"     • Цены: {comp['price_errors']}")
-        print(f"     • Количества: {comp['quantity_errors']}")
-        print(f"     • Суммы: {comp['amount_errors']}")
-        print(f"   Всего ошибок: {comp['total_errors']} из {comp['total_rows'] * 4} полей")
-        print(f"   Точность: {comp['accuracy']:.1f}%")
+        print(f"{i}. 📄 {result['file']}", file=buf)
+        print(f"   Промпт: {result['prompt']}", file=buf)
+        print(f"   Строк: {comp['total_rows']}", file=buf)
+        print(f"   Ошибки:", file=buf)
+        print(f"     • Артикулы: {comp['article_errors']} (критично)", file=buf)
+        print(f"     • Цены: {comp['price_errors']}", file=buf)
+        print(f"     • Количества: {comp['quantity_errors']}", file=buf)
+        print(f"     • Суммы: {comp['amount_errors']}", file=buf)
+        print(f"   Всего ошибок: {comp['total_errors']} из {comp['total_rows'] * 4} полей", file=buf)
+        print(f"   Точность: {comp['accuracy']:.1f}%", file=buf)
 
         # Показываем критические ошибки в артикулах
         if comp['article_errors'] > 0:
-            critical = [e for e in comp['errors']['article'] if e['row'] in [1, 8, 11]]
+            critical = comp['critical_article_errors']
             if critical:
-                print(f"   Критичные строки (1,8,11):")
+                print(f"   Критичные строки (1,8,11):", file=buf)
                 for err in critical[:3]:
-                    print(f"     Row {err['row']}: '{err['result']}' vs '{err['reference']}'")
+                    print(f"     Row {err['row']}: '{err['result']}' vs '{err['reference']}'", file=buf)
 
-        print()
+        print(file=buf)
 
     # Статистика по промптам
-    print("=" * 80)
-    print("СТАТИСТИКА ПО ПРОМПТАМ")
-    print("=" * 80)
-    print()
+    print("=" * 80, file=buf)
+    print("СТАТИСТИКА ПО ПРОМПТАМ", file=buf)
+    print("=" * 80, file=buf)
+    print(file=buf)
 
     prompt_stats = {}
     for result in results:
@@ -274,14 +514,16 @@ def main():
         prompt_stats[prompt]['total_errors'].append(result['comparison']['total_errors'])
         prompt_stats[prompt]['article_errors'].append(result['comparison']['article_errors'])
 
-    for prompt, stats in sorted(prompt_stats.items(), key=lambda x: sum(x[1]['article_errors']) / len(x[1]['article_errors'])):
+    for prompt, stats in sorted(prompt_stats.items(), key=lambda x: (sum(x[1]['article_errors']) / len(x[1]['article_errors']), x[0])):
         avg_article = sum(stats['article_errors']) / len(stats['article_errors'])
         avg_total = sum(stats['total_errors']) / len(stats['total_errors'])
-        print(f"📝 {prompt}:")
-        print(f"   Файлов: {stats['count']}")
-        print(f"   Среднее ошибок в артикулах: {avg_article:.1f}")
-        print(f"   Среднее общих ошибок: {avg_total:.1f}")
-        print()
+        print(f"📝 {prompt}:", file=buf)
+        print(f"   Файлов: {stats['count']}", file=buf)
+        print(f"   Среднее ошибок в артикулах: {avg_article:.1f}", file=buf)
+        print(f"   Среднее общих ошибок: {avg_total:.1f}", file=buf)
+        print(file=buf)
+
+    sys.stdout.write(buf.getvalue())
 
 if __name__ == "__main__":
     main()
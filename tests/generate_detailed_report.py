@@ -1,33 +1,38 @@
 #!/usr/bin/env python3
 """Генерация детального отчета по тестам v8, v9, v10"""
-import json
+import io
+import sys
 from pathlib import Path
 from datetime import datetime
 
+import orjson
+
 files = [
     "output/dnipromash_gemini-2.5-pro_12061959_8errors.json",
     "output/dnipromash_gemini-2.5-pro_12062003_8errors.json",
     "output/dnipromash_gemini-2.5-pro_12062006_8errors.json"
 ]
 
-print("# Детальные результаты тестирования v8, v9, v10")
-print("## Модель: gemini-2.5-pro")
-print("## Эталон: gemini_thinking_2_prompts_v7/dnipromash_gemini_thinking_2_prompts_v7.json")
-print("")
+# Отчет собираем в буфере и выводим одной записью
+buf = io.StringIO()
+
+print("# Детальные результаты тестирования v8, v9, v10", file=buf)
+print("## Модель: gemini-2.5-pro", file=buf)
+print("## Эталон: gemini_thinking_2_prompts_v7/dnipromash_gemini_thinking_2_prompts_v7.json", file=buf)
+print("", file=buf)
 
 for filepath in files:
     file = Path(filepath)
     if not file.exists():
         continue
 
-    with open(file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = orjson.loads(file.read_bytes())
 
     prompt = data.get("prompt", "")
     model = data.get("model", "")
 
-    print(f"## {prompt} ({model})")
-    print("")
+    print(f"## {prompt} ({model})", file=buf)
+    print("", file=buf)
 
     for test in data.get("tests", []):
         test_num = test.get("test_num", 0)
@@ -41,10 +46,10 @@ for filepath in files:
         except:
             time_str = timestamp.split('T')[1].split('.')[0] if 'T' in timestamp else ""
 
-        print(f"### ПАРСИНГ {test_num}: {time_str} ({errors} ошибки)")
-        print("")
-        print("| № | Раздел | Поле | Ожидается | Получено |")
-        print("|---|--------|------|-----------|----------|")
+        print(f"### ПАРСИНГ {test_num}: {time_str} ({errors} ошибки)", file=buf)
+        print("", file=buf)
+        print("| № | Раздел | Поле | Ожидается | Получено |", file=buf)
+        print("|---|--------|------|-----------|----------|", file=buf)
 
         all_differences = test.get("test_results", {}).get("all_differences", [])
         for diff in all_differences:
@@ -52,9 +57,10 @@ for filepath in files:
             path = diff.get("path", diff.get("field", ""))
             expected = str(diff.get("expected", ""))
             actual = str(diff.get("actual", ""))
-            print(f"| {line} | {path} | {expected} | {actual} |")
+            print(f"| {line} | {path} | {expected} | {actual} |", file=buf)
 
-        print("")
-        print("---")
-        print("")
+        print("", file=buf)
+        print("---", file=buf)
+        print("", file=buf)
 
+sys.stdout.write(buf.getvalue())
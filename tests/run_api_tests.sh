@@ -14,7 +14,9 @@ fi
 
 # Запускаем тесты в контейнере
 echo "📋 Запуск тестов..."
+# Кеш pytest (.pytest_cache) внутри контейнера не нужен - отключаем его запись
 docker-compose exec -T app python -m pytest \
+    -p no:cacheprovider \
     tests/test_web_api.py \
     tests/test_frontend_data_structure.py \
     -v \
@@ -2,13 +2,18 @@
 """
 Дополнительные тесты для items_v3.txt и items_v4.txt
 """
-import json
+import asyncio
+import os
 import sys
+import traceback
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import time
 
+import orjson
+
 # Добавляем корневую директорию в путь
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
@@ -16,14 +21,28 @@ from src.invoiceparser.core.config import Config
 from src.invoiceparser.services.orchestrator import Orchestrator
 from src.invoiceparser.core.errors import ProcessingError
 
+from _article_compare import compare
 
-def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) -> Dict[str, Any]:
-    """Анализ ошибок в артикулах"""
-    try:
-        with open(reference_file, 'r', encoding='utf-8') as f:
-            ref_data = json.load(f)
+# Директории конфигурации и их расположение в проекте при локальном запуске
+_LOCAL_DIRS = (
+    ('output_dir', 'output'),
+    ('temp_dir', 'temp'),
+    ('logs_dir', 'logs'),
+    ('invoices_dir', 'invoices'),
+    ('examples_dir', 'examples'),
+    ('prompts_dir', 'prompts'),
+)
 
-        ref_items = ref_data.get('table_data', {}).get('line_items', [])
+# Пути к промптам - переносятся в prompts_dir с тем же именем файла
+_PROMPT_PATHS = ('prompt_header_path', 'prompt_items_path')
+
+# Пауза между тестами в секундах (0 - без пауз), например INVOICE_TEST_RATE_LIMIT=2
+RATE_LIMIT_SECONDS = float(os.environ.get('INVOICE_TEST_RATE_LIMIT', '0'))
+
+
+def analyze_article_errors(parsed_data: Dict[str, Any], ref_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Анализ ошибок в артикулах (эталонные строки загружаются один раз в main)"""
+    try:
         result_items = parsed_data.get('table_data', {}).get('line_items', [])
 
         if not result_items:
@@ -34,62 +53,22 @@ def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) ->
                 "error": "Не найдены строки в результате"
             }
 
-        # Находим ключ артикула
-        ref_art_key = 'article'
-        result_art_key = None
+        comparison = compare(result_items, ref_items, 'article')
 
-        for k in result_items[0].keys():
-            k_lower = k.lower()
-            if ('article' in k_lower or 'sku' in k_lower) and 'suffix' not in k_lower:
-                result_art_key = k
-                break
-
-        if not result_art_key:
+        if 'error' in comparison:
+            key_missing = comparison['error'] == 'Article key not found'
             return {
                 "total_rows": len(result_items),
                 "errors": [],
                 "error_count": 0,
-                "error": "Не найден ключ артикула в результате"
+                "error": "Не найден ключ артикула в результате" if key_missing else comparison['error']
             }
 
-        # Проверяем наличие suffix
-        suffix_key = None
-        for k in result_items[0].keys():
-            k_lower = k.lower()
-            if ('suffix' in k_lower or 'modifier' in k_lower) and k != result_art_key:
-                suffix_key = k
-                break
-
-        # Объединяем suffix если есть
-        if suffix_key:
-            for row in result_items:
-                article_val = str(row.get(result_art_key, '')).strip()
-                suffix_val = str(row.get(suffix_key, '')).strip()
-                if suffix_val:
-                    row[result_art_key] = article_val + suffix_val
-
-        # Сравниваем
-        min_len = min(len(result_items), len(ref_items))
-        errors = []
-
-        for i in range(min_len):
-            result_art = str(result_items[i].get(result_art_key, '')).strip()
-            ref_art = str(ref_items[i].get(ref_art_key, '')).strip()
-
-            result_clean = result_art.replace(' ', '').replace('.', '').replace('-', '')
-            ref_clean = ref_art.replace(' ', '').replace('.', '').replace('-', '')
-
-            if result_clean != ref_clean:
-                errors.append({
-                    'row': i + 1,
-                    'result': result_art,
-                    'reference': ref_art
-                })
-
+        errors = comparison['errors']
         return {
-            "total_rows": min_len,
+            "total_rows": comparison['total_rows'],
             "errors": errors,
-            "error_count": len(errors),
+            "error_count": comparison['errors_count'],
             "critical_row_11": any(err['row'] == 11 for err in errors)
         }
     except Exception as e:
@@ -101,40 +80,36 @@ def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) ->
         }
 
 
-def run_single_test(prompt_name: str, test_number: int, total_tests: int, output_dir: Path,
-                   test_file: Path, reference_file: Path) -> Dict[str, Any]:
-    """Запуск одного теста"""
-    print("=" * 80)
-    print(f"ТЕСТ {test_number}/{total_tests}: {prompt_name}")
-    print("=" * 80)
-    print()
-
-    # Загружаем базовую конфигурацию
+def load_local_config() -> Config:
+    """Загружает конфигурацию и исправляет пути /app для локального запуска"""
     config = Config.load()
 
     # Исправляем пути для локального запуска
     project_root = Path(__file__).parent.parent
-    if str(config.output_dir).startswith('/app'):
-        config.output_dir = project_root / "output"
-    if str(config.temp_dir).startswith('/app'):
-        config.temp_dir = project_root / "temp"
-    if str(config.logs_dir).startswith('/app'):
-        config.logs_dir = project_root / "logs"
-    if str(config.invoices_dir).startswith('/app'):
-        config.invoices_dir = project_root / "invoices"
-    if str(config.examples_dir).startswith('/app'):
-        config.examples_dir = project_root / "examples"
-    if str(config.prompts_dir).startswith('/app'):
-        config.prompts_dir = project_root / "prompts"
+    for attr, subdir in _LOCAL_DIRS:
+        if str(getattr(config, attr)).startswith('/app'):
+            setattr(config, attr, project_root / subdir)
 
     # Исправляем пути к промптам
-    if str(config.prompt_header_path).startswith('/app'):
-        config.prompt_header_path = config.prompts_dir / config.prompt_header_path.name
-    if str(config.prompt_items_path).startswith('/app'):
-        config.prompt_items_path = config.prompts_dir / config.prompt_items_path.name
+    for attr in _PROMPT_PATHS:
+        path = getattr(config, attr)
+        if str(path).startswith('/app'):
+            setattr(config, attr, config.prompts_dir / path.name)
+
+    return config
+
+
+def run_single_test(prompt_name: str, test_number: int, total_tests: int, base_config: Config,
+                   output_dir: Path, test_file: Path, reference_file: Optional[Path],
+                   ref_items: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Запуск одного теста (base_config загружается один раз в main)"""
+    print("=" * 80)
+    print(f"ТЕСТ {test_number}/{total_tests}: {prompt_name}")
+    print("=" * 80)
+    print()
 
-    # Устанавливаем нужный промпт
-    config.prompt_items_path = config.prompts_dir / prompt_name
+    # Копия базовой конфигурации с нужным промптом
+    config = base_config.model_copy(update={'prompt_items_path': base_config.prompts_dir / prompt_name})
 
     print(f"Промпт: {prompt_name}")
     print(f"Обработка файла: {test_file}")
@@ -144,10 +119,11 @@ def run_single_test(prompt_name: str, test_number: int, total_tests: int, output
         # Создаем оркестратор
         orchestrator = Orchestrator(config)
 
-        # Обрабатываем документ
-        start_time = datetime.now()
-        result = orchestrator.process_document(test_file, compare_with=reference_file)
-        elapsed_time = (datetime.now() - start_time).total_seconds()
+        # Обрабатываем документ (process_document - корутина; на каждый тест
+        # свой оркестратор, поэтому достаточно отдельного event loop)
+        start = time.perf_counter()
+        result = asyncio.run(orchestrator.process_document(test_file, compare_with=reference_file))
+        elapsed_time = time.perf_counter() - start
 
         # Сохраняем результат ВСЕГДА
         timestamp = datetime.now().strftime("%m%d%H%M%S")
@@ -161,8 +137,7 @@ def run_single_test(prompt_name: str, test_number: int, total_tests: int, output
             "result": result
         }
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result_to_save, f, ensure_ascii=False, indent=2)
+        output_file.write_bytes(orjson.dumps(result_to_save, option=orjson.OPT_INDENT_2))
 
         if not result.get("success"):
             error_msg = result.get('error', 'Unknown error')
@@ -184,8 +159,8 @@ def run_single_test(prompt_name: str, test_number: int, total_tests: int, output
 
         # Анализ ошибок в артикулах
         article_analysis = {}
-        if reference_file and reference_file.exists():
-            article_analysis = analyze_article_errors(parsed_data, reference_file)
+        if ref_items is not None:
+            article_analysis = analyze_article_errors(parsed_data, ref_items)
 
             print("АНАЛИЗ ОШИБОК В АРТИКУЛАХ:")
             print(f"  • Всего строк: {article_analysis.get('total_rows', 0)}")
@@ -220,7 +195,6 @@ def run_single_test(prompt_name: str, test_number: int, total_tests: int, output
 
     except Exception as e:
         print(f"❌ Неожиданная ошибка: {e}")
-        import traceback
         traceback.print_exc()
         return {
             "prompt": prompt_name,
@@ -250,6 +224,15 @@ def main():
         print(f"⚠️  Эталонный файл не найден: {reference_file}")
         reference_file = None
 
+    # Конфигурацию загружаем и исправляем один раз для всех тестов
+    base_config = load_local_config()
+
+    # Эталон разбираем один раз для всех тестов
+    ref_items = None
+    if reference_file:
+        ref_data = orjson.loads(reference_file.read_bytes())
+        ref_items = ref_data.get('table_data', {}).get('line_items', [])
+
     # Создаем директорию для результатов
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
@@ -262,7 +245,7 @@ def main():
 
     # Запускаем тесты
     results = []
-    start_time = datetime.now()
+    start = time.perf_counter()
 
     for prompt_name, num_tests in tests_plan:
         print(f"\n{'='*80}")
@@ -270,53 +253,57 @@ def main():
         print(f"{'='*80}\n")
 
         for i in range(1, num_tests + 1):
-            result = run_single_test(prompt_name, i, num_tests, output_dir, test_file, reference_file)
-            results.append(result)
-
-            # Пауза между тестами
-            if i < num_tests or (prompt_name == "items_v3.txt" and num_tests == 3):
-                print("Пауза 2 секунды перед следующим тестом...")
-                time.sleep(2)
+            # Пауза между тестами - только если API требует ограничения частоты
+            if RATE_LIMIT_SECONDS and results:
+                print(f"Пауза {RATE_LIMIT_SECONDS:g} секунд перед следующим тестом...")
+                time.sleep(RATE_LIMIT_SECONDS)
                 print()
 
-    total_time = (datetime.now() - start_time).total_seconds()
+            result = run_single_test(
+                prompt_name, i, num_tests, base_config, output_dir, test_file, reference_file, ref_items
+            )
+            results.append(result)
+
+    total_time = time.perf_counter() - start
 
     # Сохраняем сводный отчет
     summary_file = output_dir / f"additional_tests_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    # Один проход: счетчики успешных тестов и группировка по промптам
+    successful_tests = 0
+    results_by_prompt = {}
+    for result in results:
+        prompt_data = results_by_prompt.setdefault(result.get("prompt", "unknown"), {
+            "tests": [],
+            "error_counts": []
+        })
+        prompt_data["tests"].append(result)
+        if result.get("success"):
+            successful_tests += 1
+            if result.get("article_errors") is not None:
+                prompt_data["error_counts"].append(result["article_errors"])
+
     summary = {
         "total_tests": len(results),
-        "successful_tests": sum(1 for r in results if r.get("success")),
-        "failed_tests": sum(1 for r in results if not r.get("success")),
+        "successful_tests": successful_tests,
+        "failed_tests": len(results) - successful_tests,
         "total_time_seconds": total_time,
-        "results_by_prompt": {},
+        "results_by_prompt": results_by_prompt,
         "results": results
     }
 
-    # Группируем по промптам
-    for result in results:
-        prompt = result.get("prompt", "unknown")
-        if prompt not in summary["results_by_prompt"]:
-            summary["results_by_prompt"][prompt] = {
-                "tests": [],
-                "error_counts": []
-            }
-        summary["results_by_prompt"][prompt]["tests"].append(result)
-        if result.get("success") and result.get("article_errors") is not None:
-            summary["results_by_prompt"][prompt]["error_counts"].append(result.get("article_errors", 0))
-
     # Добавляем статистику по промптам
     for prompt, data in summary["results_by_prompt"].items():
         error_counts = data["error_counts"]
         if error_counts:
-            data["min_errors"] = min(error_counts)
-            data["max_errors"] = max(error_counts)
+            distribution = Counter(error_counts)
+            data["min_errors"] = min(distribution)
+            data["max_errors"] = max(distribution)
             data["avg_errors"] = sum(error_counts) / len(error_counts)
-            data["distribution"] = {}
-            for err in error_counts:
-                data["distribution"][err] = data["distribution"].get(err, 0) + 1
+            data["distribution"] = dict(distribution)
 
-    with open(summary_file, 'w', encoding='utf-8') as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
+    # distribution использует числовые ключи - как и json, пишем их строками
+    summary_file.write_bytes(orjson.dumps(summary, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     # Выводим итоговую сводку
     print("=" * 80)
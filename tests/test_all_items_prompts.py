@@ -2,104 +2,92 @@
 """
 Тестирование всех items промптов на dnipromash.jpg
 """
+import asyncio
+import os
 import sys
-import json
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+import orjson
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from invoiceparser.core.config import Config
 from invoiceparser.services.orchestrator import Orchestrator
 
+from _article_compare import compare, find_article_key
+
 logging.basicConfig(level=logging.WARNING)  # Только ошибки
 logger = logging.getLogger("test_all_prompts")
 
+# Колонки артикула (в результате и в эталоне); суффикс не присоединяется
+_ART_TOKENS = ('article', 'sku', 'item_code', 'product_code')
+
+# Оркестратор и event loop процесса-обработчика (заполняются _init_worker)
+_worker_orchestrator: Optional[Orchestrator] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _init_worker(header_prompt: Path) -> None:
+    """
+    Создает оркестратор один раз на процесс пула
+
+    Промпт items читается из config при каждом вызове, поэтому между
+    промптами достаточно подменить prompt_items_path. Один event loop на
+    процесс сохраняет асинхронные клиенты оркестратора (БД) рабочими
+    между вызовами.
+    """
+    global _worker_orchestrator, _worker_loop
+    config = Config()
+    config.prompt_header_path = header_prompt
+    _worker_orchestrator = Orchestrator(config)
+    _worker_loop = asyncio.new_event_loop()
+
 def test_prompt(prompt_path: Path, output_dir: Path, invoices_dir: Path):
-    """Тестирует один промпт"""
-    try:
-        config = Config()
-        config.prompt_items_path = prompt_path
-        config.prompt_header_path = base_dir / "prompts/header_v8.txt"  # Используем v8 для header
+    """
+    Тестирует один промпт (выполняется в процессе пула)
 
-        orchestrator = Orchestrator(config)
+    Returns:
+        (путь к сохраненному результату, данные результата, ошибка)
+    """
+    try:
+        _worker_orchestrator.config.prompt_items_path = prompt_path
 
         invoice_file = invoices_dir / "dnipromash.jpg"
-        result = orchestrator.process_document(invoice_file)
+        result = _worker_loop.run_until_complete(_worker_orchestrator.process_document(invoice_file))
 
         if not result.get("success"):
-            return None, result.get("error", "Unknown error")
+            return None, None, result.get("error", "Unknown error")
 
         # Сохраняем результат
         output_name = f"dnipromash_{prompt_path.stem}.json"
         output_path = output_dir / output_name
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result['data'], f, ensure_ascii=False, indent=2)
+        output_path.write_bytes(orjson.dumps(result['data'], option=orjson.OPT_INDENT_2))
 
-        return output_path, None
+        return output_path, result['data'], None
 
     except Exception as e:
-        return None, str(e)
+        return None, None, str(e)
 
-def compare_with_reference(result_file: Path, reference_file: Path) -> Dict[str, Any]:
-    """Сравнивает результат с эталоном, фокусируясь на артикулах"""
+def compare_with_reference(result_data: Dict[str, Any], ref_items: List[Dict[str, Any]], ref_art_key: Optional[str]) -> Dict[str, Any]:
+    """Сравнивает результат с эталоном (уже загруженным), фокусируясь на артикулах"""
     try:
-        with open(result_file, 'r') as f:
-            result_data = json.load(f)
-        with open(reference_file, 'r') as f:
-            ref_data = json.load(f)
-
         result_items = result_data.get('table_data', {}).get('line_items', [])
-        ref_items = ref_data.get('table_data', {}).get('line_items', [])
-
-        if not result_items or not ref_items:
-            return {'error': 'Empty items'}
-
-        # Находим ключ артикула в результате
-        result_art_key = None
-        for k in result_items[0].keys():
-            if any(x in k.lower() for x in ['article', 'sku', 'item_code', 'product_code']):
-                result_art_key = k
-                break
-
-        # Находим ключ артикула в эталоне
-        ref_art_key = None
-        for k in ref_items[0].keys():
-            if any(x in k.lower() for x in ['article', 'sku', 'item_code', 'product_code']):
-                ref_art_key = k
-                break
-
-        if not result_art_key or not ref_art_key:
-            return {'error': 'Article key not found'}
-
-        # Сравниваем артикулы
-        min_len = min(len(result_items), len(ref_items))
-        errors = []
-        perfect = True
-
-        for i in range(min_len):
-            result_art = str(result_items[i].get(result_art_key, '')).strip()
-            ref_art = str(ref_items[i].get(ref_art_key, '')).strip()
-
-            # Нормализация для сравнения
-            result_clean = result_art.replace(' ', '').replace('.', '').replace('-', '').replace('/', '')
-            ref_clean = ref_art.replace(' ', '').replace('.', '').replace('-', '').replace('/', '')
-
-            if result_clean != ref_clean:
-                perfect = False
-                errors.append({
-                    'row': i + 1,
-                    'result': result_art,
-                    'reference': ref_art
-                })
+
+        comparison = compare(
+            result_items, ref_items, ref_art_key, join_suffix=False, ignore_slash=True, max_errors=5,
+            art_tokens=_ART_TOKENS, skip_suffix_keys=False
+        )
+        if 'error' in comparison:
+            return comparison
 
         return {
-            'perfect': perfect,
-            'total_rows': min_len,
-            'errors_count': len(errors),
-            'errors': errors[:5]  # Первые 5 ошибок
+            'perfect': comparison['errors_count'] == 0,
+            'total_rows': comparison['total_rows'],
+            'errors_count': comparison['errors_count'],
+            'errors': comparison['errors']  # Первые 5 ошибок
         }
 
     except Exception as e:
@@ -113,6 +101,12 @@ def main():
 
     invoices_dir = base_dir / "invoices"
     reference_file = base_dir / "examples/gemini_thinking_2_prompts_v7/dnipromash_gemini_thinking_2_prompts_v7.json"
+    header_prompt = base_dir / "prompts/header_v8.txt"  # Используем v8 для header
+
+    # Эталон разбираем один раз для всех промптов
+    ref_data = orjson.loads(reference_file.read_bytes())
+    ref_items = ref_data.get('table_data', {}).get('line_items', [])
+    ref_art_key = find_article_key(ref_items[0], _ART_TOKENS, skip_suffix_keys=False) if ref_items else None
 
     # Находим все items промпты
     items_prompts = sorted(prompts_dir.glob("items*.txt"))
@@ -124,12 +118,28 @@ def main():
     print(f"🔍 Testing {len(items_prompts)} prompts on dnipromash.jpg\n")
     print("=" * 80)
 
+    # Промпты независимы: обрабатываем параллельно
+    outputs = {}
+    max_workers = min(len(items_prompts), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(header_prompt,)) as executor:
+        futures = {
+            executor.submit(test_prompt, prompt_path, output_dir, invoices_dir): prompt_path
+            for prompt_path in items_prompts
+        }
+        for future in as_completed(futures):
+            prompt_path = futures[future]
+            try:
+                outputs[prompt_path] = future.result()
+            except Exception as e:  # например, сбой инициализации процесса пула
+                outputs[prompt_path] = (None, None, str(e))
+            print(f"   ⏱  Done: {prompt_path.name}")
+
     results = []
 
     for prompt_path in items_prompts:
         print(f"\n📄 Testing: {prompt_path.name}")
 
-        output_file, error = test_prompt(prompt_path, output_dir, invoices_dir)
+        output_file, result_data, error = outputs[prompt_path]
 
         if error:
             print(f"   ❌ ERROR: {error}")
@@ -140,8 +150,8 @@ def main():
             })
             continue
 
-        # Сравниваем с эталоном
-        comparison = compare_with_reference(output_file, reference_file)
+        # Сравниваем с эталоном (результат уже в памяти, файл не перечитываем)
+        comparison = compare_with_reference(result_data, ref_items, ref_art_key)
 
         if 'error' in comparison:
             print(f"   ⚠️  Comparison error: {comparison['error']}")
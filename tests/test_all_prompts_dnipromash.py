@@ -2,115 +2,90 @@
 """
 Тестирование всех items промптов на dnipromash.jpg
 """
+import asyncio
+import os
 import sys
-import json
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+import orjson
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from invoiceparser.core.config import Config
 from invoiceparser.services.orchestrator import Orchestrator
 
+from _article_compare import compare, find_article_key
+
 logging.basicConfig(level=logging.WARNING)  # Только ошибки
 logger = logging.getLogger("test_all_prompts")
 
-def test_prompt(prompt_path: Path, output_dir: Path, invoices_dir: Path, header_prompt: Path):
-    """Тестирует один промпт"""
+# Колонки артикула и суффикса в результате; в эталоне артикул - колонка 'article'
+_ART_TOKENS = ('article', 'sku', 'item_code')
+_SUFFIX_TOKENS = ('suffix', 'modifier', 'subcode')
+_REF_ART_TOKENS = ('article',)
+
+# Оркестратор и event loop процесса-обработчика (заполняются _init_worker)
+_worker_orchestrator: Optional[Orchestrator] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _init_worker(header_prompt: Path) -> None:
+    """
+    Создает оркестратор один раз на процесс пула
+
+    Промпт items читается из config при каждом вызове, поэтому между
+    промптами достаточно подменить prompt_items_path. Один event loop на
+    процесс сохраняет асинхронные клиенты оркестратора (БД) рабочими
+    между вызовами.
+    """
+    global _worker_orchestrator, _worker_loop
+    config = Config()
+    config.prompt_header_path = header_prompt
+    _worker_orchestrator = Orchestrator(config)
+    _worker_loop = asyncio.new_event_loop()
+
+def test_prompt(prompt_path: Path, output_dir: Path, invoices_dir: Path):
+    """
+    Тестирует один промпт (выполняется в процессе пула)
+
+    Returns:
+        (путь к сохраненному результату, данные результата, ошибка)
+    """
     try:
-        config = Config()
-        config.prompt_items_path = prompt_path
-        config.prompt_header_path = header_prompt
-
-        orchestrator = Orchestrator(config)
+        _worker_orchestrator.config.prompt_items_path = prompt_path
 
         invoice_file = invoices_dir / "dnipromash.jpg"
-        result = orchestrator.process_document(invoice_file)
+        result = _worker_loop.run_until_complete(_worker_orchestrator.process_document(invoice_file))
 
         if not result.get("success"):
-            return None, result.get("error", "Unknown error")
+            return None, None, result.get("error", "Unknown error")
 
         # Сохраняем результат
         prompt_name = prompt_path.stem
         output_name = f"dnipromash_{prompt_name}_test.json"
         output_path = output_dir / output_name
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result['data'], f, ensure_ascii=False, indent=2)
+        output_path.write_bytes(orjson.dumps(result['data'], option=orjson.OPT_INDENT_2))
 
-        return output_path, None
+        return output_path, result['data'], None
 
     except Exception as e:
-        return None, str(e)
+        return None, None, str(e)
 
-def compare_articles(result_file: Path, reference_file: Path) -> Dict[str, Any]:
-    """Сравнивает артикулы с эталоном"""
+def compare_articles(result_data: Dict[str, Any], ref_items: List[Dict[str, Any]], ref_art_key: Optional[str]) -> Dict[str, Any]:
+    """Сравнивает артикулы с эталоном (уже загруженным), объединяя suffix если он есть"""
     try:
-        with open(result_file, 'r', encoding='utf-8') as f:
-            result_data = json.load(f)
-        with open(reference_file, 'r', encoding='utf-8') as f:
-            ref_data = json.load(f)
-
         result_items = result_data.get('table_data', {}).get('line_items', [])
-        ref_items = ref_data.get('table_data', {}).get('line_items', [])
-
-        if not result_items or not ref_items:
-            return {'error': 'Empty items'}
-
-        # Находим ключи артикулов
-        result_art_key = None
-        for k in result_items[0].keys():
-            if any(x in k.lower() for x in ['article', 'sku', 'item_code']):
-                result_art_key = k
-                break
-
-        ref_art_key = next((k for k in ref_items[0].keys() if 'article' in k.lower()), None)
-
-        if not result_art_key or not ref_art_key:
-            return {'error': 'Article key not found'}
-
-        # Проверяем наличие suffix и объединяем если нужно
-        suffix_key = None
-        for k in result_items[0].keys():
-            k_lower = k.lower()
-            if ('suffix' in k_lower or 'modifier' in k_lower or 'subcode' in k_lower) and k != result_art_key:
-                suffix_key = k
-                break
-
-        # Объединяем suffix если есть
-        if suffix_key:
-            for row in result_items:
-                article_val = str(row.get(result_art_key, '')).strip()
-                suffix_val = str(row.get(suffix_key, '')).strip()
-                if suffix_val and suffix_val != '':
-                    row[result_art_key] = article_val + suffix_val
-
-        # Сравниваем артикулы
-        min_len = min(len(result_items), len(ref_items))
-        errors = []
-
-        for i in range(min_len):
-            result_art = str(result_items[i].get(result_art_key, '')).strip()
-            ref_art = str(ref_items[i].get(ref_art_key, '')).strip()
-
-            result_clean = result_art.replace(' ', '').replace('.', '').replace('-', '')
-            ref_clean = ref_art.replace(' ', '').replace('.', '').replace('-', '')
-
-            if result_clean != ref_clean:
-                errors.append({
-                    'row': i + 1,
-                    'result': result_art,
-                    'reference': ref_art
-                })
-
-        return {
-            'total_rows': min_len,
-            'errors_count': len(errors),
-            'errors': errors,
-            'has_suffix': suffix_key is not None,
-            'suffix_key': suffix_key
-        }
+
+        comparison = compare(
+            result_items, ref_items, ref_art_key,
+            art_tokens=_ART_TOKENS, suffix_tokens=_SUFFIX_TOKENS, skip_suffix_keys=False
+        )
+        if 'error' not in comparison:
+            comparison['has_suffix'] = comparison['suffix_key'] is not None
+        return comparison
 
     except Exception as e:
         return {'error': str(e)}
@@ -125,6 +100,11 @@ def main():
     reference_file = base_dir / "examples/gemini_thinking_2_prompts_v7/dnipromash_gemini_thinking_2_prompts_v7.json"
     header_prompt = base_dir / "prompts/header_v8.txt"
 
+    # Эталон разбираем один раз для всех промптов
+    ref_data = orjson.loads(reference_file.read_bytes())
+    ref_items = ref_data.get('table_data', {}).get('line_items', [])
+    ref_art_key = find_article_key(ref_items[0], _REF_ART_TOKENS, skip_suffix_keys=False) if ref_items else None
+
     # Находим все items промпты
     items_prompts = sorted(prompts_dir.glob("items*.txt"))
 
@@ -137,12 +117,29 @@ def main():
     print("=" * 80)
     print()
 
+    # Промпты независимы: обрабатываем параллельно
+    outputs = {}
+    max_workers = min(len(items_prompts), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(header_prompt,)) as executor:
+        futures = {
+            executor.submit(test_prompt, prompt_path, output_dir, invoices_dir): prompt_path
+            for prompt_path in items_prompts
+        }
+        for future in as_completed(futures):
+            prompt_path = futures[future]
+            try:
+                outputs[prompt_path] = future.result()
+            except Exception as e:  # например, сбой инициализации процесса пула
+                outputs[prompt_path] = (None, None, str(e))
+            print(f"⏱  Done: {prompt_path.name}")
+        print()
+
     results = []
 
     for prompt_path in items_prompts:
         print(f"📄 Testing: {prompt_path.name}")
 
-        output_file, error = test_prompt(prompt_path, output_dir, invoices_dir, header_prompt)
+        output_file, result_data, error = outputs[prompt_path]
 
         if error:
             print(f"   ❌ ERROR: {error}")
@@ -153,8 +150,8 @@ def main():
             })
             continue
 
-        # Сравниваем с эталоном
-        comparison = compare_articles(output_file, reference_file)
+        # Сравниваем с эталоном (результат уже в памяти, файл не перечитываем)
+        comparison = compare_articles(result_data, ref_items, ref_art_key)
 
         if 'error' in comparison:
             print(f"   ⚠️  Comparison error: {comparison['error']}")
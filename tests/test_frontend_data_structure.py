@@ -9,17 +9,10 @@ import json
 from pathlib import Path
 
 
-def test_frontend_expected_fields():
-    """
-    Проверка списка полей, которые фронтенд использует
-
-    На основе анализа script.js:
-    - displayEditableData() использует определенные поля
-    - displayHeaderInfo() использует invoice_number, invoice_date и т.д.
-    - displayItemsTable() использует line_items или items
-    """
-    # Поля, которые фронтенд ожидает найти
-    expected_fields = {
+@pytest.fixture(scope="module")
+def expected_fields():
+    """Поля, которые фронтенд ожидает найти"""
+    return {
         # Для displayHeaderInfo
         "invoice_number": "Номер документа",
         "invoice_date": "Дата документа",
@@ -59,6 +52,16 @@ def test_frontend_expected_fields():
         "column_mapping": "Маппинг колонок для таблицы"
     }
 
+
+def test_frontend_expected_fields(expected_fields):
+    """
+    Проверка списка полей, которые фронтенд использует
+
+    На основе анализа script.js:
+    - displayEditableData() использует определенные поля
+    - displayHeaderInfo() использует invoice_number, invoice_date и т.д.
+    - displayItemsTable() использует line_items или items
+    """
     # Проверяем, что структура определена
     assert isinstance(expected_fields, dict)
     assert "document_info" in expected_fields
@@ -66,17 +69,10 @@ def test_frontend_expected_fields():
     assert "totals" in expected_fields
 
 
-def test_field_labels_structure():
-    """
-    Проверка структуры меток полей
-
-    Фронтенд поддерживает:
-    1. Поля с суффиксом _label (например, document_type_label)
-    2. Предопределенные метки в fieldLabels объекте
-    3. Имя поля как fallback
-    """
-    # Пример данных с _label полями
-    data_with_labels = {
+@pytest.fixture(scope="module")
+def data_with_labels():
+    """Пример данных с _label полями"""
+    return {
         "document_info": {
             "document_type": "Invoice",
             "document_type_label": "Тип документа:",
@@ -85,6 +81,16 @@ def test_field_labels_structure():
         }
     }
 
+
+def test_field_labels_structure(data_with_labels):
+    """
+    Проверка структуры меток полей
+
+    Фронтенд поддерживает:
+    1. Поля с суффиксом _label (например, document_type_label)
+    2. Предопределенные метки в fieldLabels объекте
+    3. Имя поля как fallback
+    """
     # Проверяем паттерн
     for key, value in data_with_labels["document_info"].items():
         if key.endswith("_label"):
@@ -92,16 +98,10 @@ def test_field_labels_structure():
             assert base_key in data_with_labels["document_info"]
 
 
-def test_line_items_structure():
-    """
-    Проверка структуры товаров для таблицы
-
-    Фронтенд ожидает:
-    - line_items или items - массив объектов
-    - column_mapping - словарь для заголовков таблицы
-    - Каждый item должен иметь поля из column_mapping
-    """
-    example_structure = {
+@pytest.fixture(scope="module")
+def line_items_structure():
+    """Пример товаров с column_mapping"""
+    return {
         "column_mapping": {
             "line_number": "№",
             "product_name": "Товар",
@@ -118,19 +118,39 @@ def test_line_items_structure():
         ]
     }
 
+
+def test_line_items_structure(line_items_structure):
+    """
+    Проверка структуры товаров для таблицы
+
+    Фронтенд ожидает:
+    - line_items или items - массив объектов
+    - column_mapping - словарь для заголовков таблицы
+    - Каждый item должен иметь поля из column_mapping
+    """
     # Проверяем структуру
-    assert "column_mapping" in example_structure
-    assert "line_items" in example_structure
-    assert isinstance(example_structure["line_items"], list)
+    assert "column_mapping" in line_items_structure
+    assert "line_items" in line_items_structure
+    assert isinstance(line_items_structure["line_items"], list)
 
-    if example_structure["line_items"]:
-        first_item = example_structure["line_items"][0]
+    if line_items_structure["line_items"]:
+        first_item = line_items_structure["line_items"][0]
         # Проверяем, что ключи item соответствуют column_mapping
-        for key in example_structure["column_mapping"].keys():
+        for key in line_items_structure["column_mapping"].keys():
             assert key in first_item, f"Поле {key} отсутствует в line_item"
 
 
-def test_save_response_structure():
+@pytest.fixture(scope="module")
+def save_response():
+    """Пример ответа /save"""
+    return {
+        "success": True,
+        "filename": "invoice_saved_07120130.json",
+        "message": "Данные успешно сохранены..."
+    }
+
+
+def test_save_response_structure(save_response):
     """
     Проверка структуры ответа /save
 
@@ -141,25 +161,31 @@ def test_save_response_structure():
         "message": str (optional)
     }
     """
-    expected_response = {
-        "success": True,
-        "filename": "invoice_saved_07120130.json",
-        "message": "Данные успешно сохранены..."
-    }
-
     # Проверяем обязательные поля
-    assert "success" in expected_response
-    assert "filename" in expected_response
-    assert isinstance(expected_response["success"], bool)
-    assert isinstance(expected_response["filename"], str)
+    assert "success" in save_response
+    assert "filename" in save_response
+    assert isinstance(save_response["success"], bool)
+    assert isinstance(save_response["filename"], str)
 
     # Проверяем формат имени файла
-    if expected_response["success"]:
-        assert "_saved_" in expected_response["filename"]
-        assert expected_response["filename"].endswith(".json")
+    if save_response["success"]:
+        assert "_saved_" in save_response["filename"]
+        assert save_response["filename"].endswith(".json")
 
 
-def test_parse_response_structure():
+@pytest.fixture(scope="module")
+def parse_response():
+    """Пример ответа /parse"""
+    return {
+        "success": True,
+        "data": {
+            # Любые данные документа
+        },
+        "processed_at": "2025-12-07T00:00:00"
+    }
+
+
+def test_parse_response_structure(parse_response):
     """
     Проверка структуры ответа /parse
 
@@ -170,34 +196,20 @@ def test_parse_response_structure():
         "processed_at": str
     }
     """
-    expected_response = {
-        "success": True,
-        "data": {
-            # Любые данные документа
-        },
-        "processed_at": "2025-12-07T00:00:00"
-    }
-
     # Проверяем обязательные поля
-    assert "success" in expected_response
-    assert "data" in expected_response
-    assert "processed_at" in expected_response
-
-    assert isinstance(expected_response["success"], bool)
-    assert isinstance(expected_response["data"], dict)
-    assert isinstance(expected_response["processed_at"], str)
+    assert "success" in parse_response
+    assert "data" in parse_response
+    assert "processed_at" in parse_response
 
+    assert isinstance(parse_response["success"], bool)
+    assert isinstance(parse_response["data"], dict)
+    assert isinstance(parse_response["processed_at"], str)
 
-def test_nested_data_access():
-    """
-    Проверка доступа к вложенным данным
 
-    Фронтенд использует:
-    - data.document_info.*
-    - data.parties.supplier.*
-    - data.parties.buyer.*
-    """
-    example_data = {
+@pytest.fixture(scope="module")
+def nested_data():
+    """Пример вложенных данных документа"""
+    return {
         "document_info": {
             "document_number": "123"
         },
@@ -211,22 +223,26 @@ def test_nested_data_access():
         }
     }
 
-    # Проверяем доступ к вложенным полям
-    assert example_data.get("document_info", {}).get("document_number") == "123"
-    assert example_data.get("parties", {}).get("supplier", {}).get("name") == "Supplier"
-    assert example_data.get("parties", {}).get("buyer", {}).get("name") == "Buyer"
 
-
-def test_empty_data_handling():
+def test_nested_data_access(nested_data):
     """
-    Проверка обработки пустых данных
+    Проверка доступа к вложенным данным
 
-    Фронтенд должен корректно обрабатывать:
-    - Отсутствующие поля
-    - Пустые массивы
-    - null значения
+    Фронтенд использует:
+    - data.document_info.*
+    - data.parties.supplier.*
+    - data.parties.buyer.*
     """
-    empty_data = {
+    # Проверяем доступ к вложенным полям
+    assert nested_data.get("document_info", {}).get("document_number") == "123"
+    assert nested_data.get("parties", {}).get("supplier", {}).get("name") == "Supplier"
+    assert nested_data.get("parties", {}).get("buyer", {}).get("name") == "Buyer"
+
+
+@pytest.fixture(scope="module")
+def empty_data():
+    """Пустые данные документа"""
+    return {
         "document_info": {},
         "parties": {
             "supplier": {},
@@ -236,6 +252,16 @@ def test_empty_data_handling():
         "items": []
     }
 
+
+def test_empty_data_handling(empty_data):
+    """
+    Проверка обработки пустых данных
+
+    Фронтенд должен корректно обрабатывать:
+    - Отсутствующие поля
+    - Пустые массивы
+    - null значения
+    """
     # Проверяем, что структура валидна даже при пустых данных
     assert isinstance(empty_data["line_items"], list)
     assert len(empty_data["line_items"]) == 0
@@ -2,11 +2,20 @@
 """
 Автоматическое тестирование items_v2.txt с 20 различными настройками обработки изображений
 """
+import asyncio
+import io
 import json
+import os
 import sys
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+import orjson
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -15,6 +24,8 @@ from src.invoiceparser.core.config import Config
 from src.invoiceparser.services.orchestrator import Orchestrator
 from src.invoiceparser.core.errors import ProcessingError
 
+from _article_compare import compare
+
 
 def load_configs() -> List[Dict[str, Any]]:
     """Загрузка конфигураций из файла"""
@@ -26,6 +37,54 @@ def load_configs() -> List[Dict[str, Any]]:
         return json.load(f)
 
 
+_LOCAL_DIRS = (
+    ('output_dir', 'output'),
+    ('temp_dir', 'temp'),
+    ('logs_dir', 'logs'),
+    ('invoices_dir', 'invoices'),
+    ('examples_dir', 'examples'),
+    ('prompts_dir', 'prompts'),
+)
+_PROMPT_PATHS = ('prompt_header_path', 'prompt_items_path')
+
+# Верхняя граница числа процессов: тесты упираются в API Gemini
+MAX_WORKERS = 8
+
+# Event loop процесса-обработчика (создается в _init_worker)
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _init_worker() -> None:
+    """Создает один event loop на процесс пула для асинхронной обработки"""
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+
+
+@lru_cache(maxsize=1)
+def _base_config() -> Config:
+    """
+    Базовая конфигурация с исправленными путями /app для локального запуска
+
+    Загружается и валидируется один раз; тесты работают с ее копиями
+    (model_copy), поэтому настройки одного теста не попадают в другой.
+    """
+    config = Config.load()
+
+    # Исправляем пути для локального запуска (если они указывают на /app)
+    project_root = Path(__file__).parent.parent
+    for attr, subdir in _LOCAL_DIRS:
+        if str(getattr(config, attr)).startswith('/app'):
+            setattr(config, attr, project_root / subdir)
+
+    # Исправляем пути к промптам
+    for attr in _PROMPT_PATHS:
+        path = getattr(config, attr)
+        if str(path).startswith('/app'):
+            setattr(config, attr, config.prompts_dir / path.name)
+
+    return config
+
+
 def apply_config_to_settings(config_obj: Config, config_dict: Dict[str, Any]) -> None:
     """Применение настроек из словаря к объекту Config"""
     config_obj.enable_image_enhancement = config_dict.get("enable_image_enhancement", True)
@@ -47,13 +106,9 @@ def apply_config_to_settings(config_obj: Config, config_dict: Dict[str, Any]) ->
     config_obj.image_quality = config_dict.get("image_quality", 95)
 
 
-def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) -> Dict[str, Any]:
-    """Анализ ошибок в артикулах"""
+def analyze_article_errors(parsed_data: Dict[str, Any], ref_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Анализ ошибок в артикулах (эталонные строки загружаются один раз в main)"""
     try:
-        with open(reference_file, 'r', encoding='utf-8') as f:
-            ref_data = json.load(f)
-
-        ref_items = ref_data.get('table_data', {}).get('line_items', [])
         result_items = parsed_data.get('table_data', {}).get('line_items', [])
 
         if not result_items:
@@ -64,62 +119,22 @@ def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) ->
                 "error": "Не найдены строки в результате"
             }
 
-        # Находим ключ артикула
-        ref_art_key = 'article'
-        result_art_key = None
-
-        for k in result_items[0].keys():
-            k_lower = k.lower()
-            if ('article' in k_lower or 'sku' in k_lower) and 'suffix' not in k_lower:
-                result_art_key = k
-                break
+        comparison = compare(result_items, ref_items, 'article')
 
-        if not result_art_key:
+        if 'error' in comparison:
+            key_missing = comparison['error'] == 'Article key not found'
             return {
                 "total_rows": len(result_items),
                 "errors": [],
                 "error_count": 0,
-                "error": "Не найден ключ артикула в результате"
+                "error": "Не найден ключ артикула в результате" if key_missing else comparison['error']
             }
 
-        # Проверяем наличие suffix
-        suffix_key = None
-        for k in result_items[0].keys():
-            k_lower = k.lower()
-            if ('suffix' in k_lower or 'modifier' in k_lower) and k != result_art_key:
-                suffix_key = k
-                break
-
-        # Объединяем suffix если есть
-        if suffix_key:
-            for row in result_items:
-                article_val = str(row.get(result_art_key, '')).strip()
-                suffix_val = str(row.get(suffix_key, '')).strip()
-                if suffix_val:
-                    row[result_art_key] = article_val + suffix_val
-
-        # Сравниваем
-        min_len = min(len(result_items), len(ref_items))
-        errors = []
-
-        for i in range(min_len):
-            result_art = str(result_items[i].get(result_art_key, '')).strip()
-            ref_art = str(ref_items[i].get(ref_art_key, '')).strip()
-
-            result_clean = result_art.replace(' ', '').replace('.', '').replace('-', '')
-            ref_clean = ref_art.replace(' ', '').replace('.', '').replace('-', '')
-
-            if result_clean != ref_clean:
-                errors.append({
-                    'row': i + 1,
-                    'result': result_art,
-                    'reference': ref_art
-                })
-
+        errors = comparison['errors']
         return {
-            "total_rows": min_len,
+            "total_rows": comparison['total_rows'],
             "errors": errors,
-            "error_count": len(errors),
+            "error_count": comparison['errors_count'],
             "critical_row_11": any(err['row'] == 11 for err in errors)
         }
     except Exception as e:
@@ -131,9 +146,10 @@ def analyze_article_errors(parsed_data: Dict[str, Any], reference_file: Path) ->
         }
 
 
-def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file: Path,
-                   output_dir: Path, test_number: int) -> Dict[str, Any]:
-    """Запуск одного теста с заданной конфигурацией"""
+def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file: Optional[Path],
+                   output_dir: Path, test_number: int,
+                   ref_items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Запуск одного теста с заданной конфигурацией (эталон загружается один раз в main)"""
     config_name = config_dict.get("name", f"config_{test_number:02d}")
     description = config_dict.get("description", "")
 
@@ -143,29 +159,8 @@ def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file
     print("=" * 80)
     print()
 
-    # Загружаем базовую конфигурацию
-    config = Config.load()
-
-    # Исправляем пути для локального запуска (если они указывают на /app)
-    project_root = Path(__file__).parent.parent
-    if str(config.output_dir).startswith('/app'):
-        config.output_dir = project_root / "output"
-    if str(config.temp_dir).startswith('/app'):
-        config.temp_dir = project_root / "temp"
-    if str(config.logs_dir).startswith('/app'):
-        config.logs_dir = project_root / "logs"
-    if str(config.invoices_dir).startswith('/app'):
-        config.invoices_dir = project_root / "invoices"
-    if str(config.examples_dir).startswith('/app'):
-        config.examples_dir = project_root / "examples"
-    if str(config.prompts_dir).startswith('/app'):
-        config.prompts_dir = project_root / "prompts"
-
-    # Исправляем пути к промптам
-    if str(config.prompt_header_path).startswith('/app'):
-        config.prompt_header_path = config.prompts_dir / config.prompt_header_path.name
-    if str(config.prompt_items_path).startswith('/app'):
-        config.prompt_items_path = config.prompts_dir / config.prompt_items_path.name
+    # Копия базовой конфигурации (загружается один раз на процесс)
+    config = _base_config().model_copy()
 
     # Применяем настройки из конфигурации
     apply_config_to_settings(config, config_dict)
@@ -195,7 +190,9 @@ def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file
 
         # Обрабатываем документ
         start_time = datetime.now()
-        result = orchestrator.process_document(test_file, compare_with=reference_file)
+        result = _worker_loop.run_until_complete(
+            orchestrator.process_document(test_file, compare_with=reference_file)
+        )
         elapsed_time = (datetime.now() - start_time).total_seconds()
 
         # Сохраняем результат ВСЕГДА, даже при ошибках (чтобы не потерять данные от Gemini)
@@ -239,8 +236,8 @@ def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file
 
         # Анализ ошибок в артикулах
         article_analysis = {}
-        if reference_file and reference_file.exists():
-            article_analysis = analyze_article_errors(parsed_data, reference_file)
+        if ref_items is not None:
+            article_analysis = analyze_article_errors(parsed_data, ref_items)
 
             print("АНАЛИЗ ОШИБОК В АРТИКУЛАХ:")
             print(f"  • Всего строк: {article_analysis.get('total_rows', 0)}")
@@ -293,7 +290,6 @@ def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file
         }
     except Exception as e:
         print(f"❌ Неожиданная ошибка: {e}")
-        import traceback
         traceback.print_exc()
         return {
             "test_number": test_number,
@@ -305,6 +301,24 @@ def run_single_test(config_dict: Dict[str, Any], test_file: Path, reference_file
         }
 
 
+def _run_test_captured(config_dict: Dict[str, Any], test_file: Path, reference_file: Optional[Path],
+                       output_dir: Path, test_number: int,
+                       ref_items: Optional[List[Dict[str, Any]]] = None):
+    """
+    Запуск теста в процессе пула с перехватом его вывода
+
+    Тесты идут параллельно, поэтому вывод каждого собирается в буфер и
+    печатается в main целиком в порядке конфигураций.
+
+    Returns:
+        (результат run_single_test, вывод теста)
+    """
+    buf = io.StringIO()
+    with redirect_stdout(buf), redirect_stderr(buf):
+        result = run_single_test(config_dict, test_file, reference_file, output_dir, test_number, ref_items)
+    return result, buf.getvalue()
+
+
 def main():
     """Главная функция для запуска всех тестов"""
     print("=" * 80)
@@ -334,6 +348,12 @@ def main():
         print("   Тесты будут запущены без сравнения с эталоном")
         reference_file = None
 
+    # Эталон разбираем один раз для всех тестов
+    ref_items = None
+    if reference_file:
+        ref_data = orjson.loads(reference_file.read_bytes())
+        ref_items = ref_data.get('table_data', {}).get('line_items', [])
+
     # Создаем директорию для результатов
     output_dir = Path("output")
     output_dir.mkdir(exist_ok=True)
@@ -342,16 +362,37 @@ def main():
     results = []
     start_time = datetime.now()
 
-    for i, config_dict in enumerate(configs, 1):
-        result = run_single_test(config_dict, test_file, reference_file, output_dir, i)
-        results.append(result)
+    # Конфигурации независимы: обрабатываем параллельно
+    outputs = {}
+    max_workers = min(len(configs), os.cpu_count() or 1, MAX_WORKERS)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_run_test_captured, config_dict, test_file, reference_file, output_dir, i, ref_items): (i, config_dict)
+            for i, config_dict in enumerate(configs, 1)
+        }
+        for future in as_completed(futures):
+            i, config_dict = futures[future]
+            config_name = config_dict.get("name", f"config_{i:02d}")
+            try:
+                result, outputs[i] = future.result()
+            except Exception as e:  # например, сбой инициализации процесса пула
+                result = {
+                    "test_number": i,
+                    "config_name": config_name,
+                    "description": config_dict.get("description", ""),
+                    "success": False,
+                    "error": str(e),
+                    "elapsed_time": 0
+                }
+                outputs[i] = f"❌ Ошибка запуска теста {i}: {e}\n"
+            results.append(result)
+            print(f"⏱  Готово: {i}/{len(configs)} {config_name}")
+        print()
 
-        # Небольшая пауза между тестами
-        if i < len(configs):
-            print("Пауза 2 секунды перед следующим тестом...")
-            import time
-            time.sleep(2)
-            print()
+    # Вывод и отчет в порядке конфигураций, а не завершения
+    for i in sorted(outputs):
+        print(outputs[i], end="")
+    results.sort(key=lambda r: r["test_number"])
 
     total_time = (datetime.now() - start_time).total_seconds()
 
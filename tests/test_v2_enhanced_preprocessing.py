@@ -4,6 +4,7 @@
 """
 import json
 import sys
+import traceback
 from pathlib import Path
 from datetime import datetime
 
@@ -193,7 +194,6 @@ def test_v2_with_enhanced_preprocessing():
         print(f"❌ Ошибка обработки: {e}")
     except Exception as e:
         print(f"❌ Неожиданная ошибка: {e}")
-        import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
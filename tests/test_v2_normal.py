@@ -4,6 +4,7 @@
 """
 import json
 import sys
+import traceback
 from pathlib import Path
 from datetime import datetime
 
@@ -174,7 +175,6 @@ def test_v2_normal():
         print(f"❌ Ошибка обработки: {e}")
     except Exception as e:
         print(f"❌ Неожиданная ошибка: {e}")
-        import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@
 Тестирование items_v8.txt и items_v9.txt на dnipromash с эталоном v7 (по одному разу)
 """
 import sys
+import traceback
 import json
 from pathlib import Path
 from datetime import datetime
@@ -81,7 +82,6 @@ def test_prompt(prompt_name: str, config: Config):
 
     except Exception as e:
         print(f"✗ Исключение: {e}")
-        import traceback
         traceback.print_exc()
         return None
 
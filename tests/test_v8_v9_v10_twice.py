@@ -4,6 +4,7 @@
 По 2 раза каждый, сравнение с эталоном v7, детальные ошибки
 """
 import sys
+import traceback
 import json
 import time
 from pathlib import Path
@@ -104,7 +105,6 @@ def run_test(prompt_name: str, test_num: int, config: Config) -> Dict[str, Any]:
 
     except Exception as e:
         print(f"✗ Исключение: {e}")
-        import traceback
         traceback.print_exc()
         return {
             "prompt": prompt_name,